@@ -0,0 +1,257 @@
+# attribution.py
+
+import csv
+import math
+from array import array
+from statistics import NormalDist
+
+import numpy as np
+
+from events import EventSink, TeeSink
+from strategy import (ACTIONS, FIRST_TWO, SPLIT_TWO, LATER, PHASES, TOTALS, UP_CARDS,
+                      total_index, pair_index)
+
+# Decision states: hard totals, then soft totals, then pairs, laid out like the strategy tables
+KINDS = ('hard', 'soft', 'pair')
+TOTAL_STATES = PHASES * TOTALS * UP_CARDS
+PAIR_STATES = PHASES * UP_CARDS * UP_CARDS
+STATES = 2 * TOTAL_STATES + PAIR_STATES
+# One cell per decision state and action
+CELLS = STATES * len(ACTIONS)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+PHASE_NAMES = ('first_two', 'split_two', 'later')
+
+# Decisions recorded per hand; a hand rarely takes more than a few
+TAG_SLOTS = 24
+
+
+def decision_state(hand, up_card_value):
+    """
+    Returns the state index of a decision: the pair cell for two cards of
+    equal value, else the hard or soft total cell, as TableStrategy looks
+    them up.
+    """
+    cards = hand.cards
+    if len(cards) == 2:
+        phase = SPLIT_TWO if hand.is_split else FIRST_TWO
+        value = cards[0].get_value()
+        if value == cards[1].get_value():
+            return 2 * TOTAL_STATES + pair_index(phase, value, up_card_value)
+    else:
+        phase = LATER
+    index = total_index(phase, hand.best_value, up_card_value)
+    return index + TOTAL_STATES if hand.is_soft() else index
+
+
+def describe_cell(cell):
+    """
+    Returns (kind, phase name, total or pair card value, up-card value, action) of a cell.
+    """
+    state, action = divmod(cell, len(ACTIONS))
+    if state >= 2 * TOTAL_STATES:
+        kind = 'pair'
+        rest, up = divmod(state - 2 * TOTAL_STATES, UP_CARDS)
+        phase, total = divmod(rest, UP_CARDS)
+    else:
+        kind = 'soft' if state >= TOTAL_STATES else 'hard'
+        rest, up = divmod(state % TOTAL_STATES, UP_CARDS)
+        phase, total = divmod(rest, TOTALS)
+    return kind, PHASE_NAMES[phase], total, up, ACTIONS[action]
+
+
+class _AttributedStrategy:
+    """
+    Stands in for a player's strategy and tags each hand with the cell of
+    every decision it makes.
+    """
+
+    def __init__(self, strategy, attribution):
+        self.strategy = strategy
+        self.attribution = attribution
+
+    def decide_action(self, hand, dealer_up_card, rules):
+        action = self.strategy.decide_action(hand, dealer_up_card, rules)
+        self.attribution.record(hand, dealer_up_card.get_value(), action)
+        return action
+
+    def __getattr__(self, name):
+        return getattr(self.strategy, name)
+
+
+class EVAttribution(EventSink):
+    """
+    Attributes hand results to the decision cells (hard/soft total or
+    pair, phase, dealer up card and action) they passed through.
+
+    attach() wraps each player's strategy so that every decision is written
+    into the hand's tag slots, and tees the game's events to this collector.
+    When a hand settles, its net result per initial bet is added to the
+    count, sum and sum-of-squares arrays of each of its cells. A split
+    passes its tags on to both hands. The arrays are allocated once, so
+    collecting allocates nothing per round beyond the events themselves.
+    """
+
+    def __init__(self):
+        self.count = np.zeros(CELLS)
+        self.total = np.zeros(CELLS)
+        self.total_squared = np.zeros(CELLS)
+        self.rounds = 0
+        self.game = None
+        self._events = None
+
+    def attach(self, game):
+        """
+        Starts collecting from game and returns self.
+        """
+        if self.game is not None:
+            raise ValueError("EVAttribution is already attached to a game.")
+        self.game = game
+        self._events = game.events
+        game.events = TeeSink(game.events, self)
+        for player in game.players:
+            if player.strategy is not None:
+                player.strategy = _AttributedStrategy(player.strategy, self)
+        return self
+
+    def detach(self):
+        """
+        Restores the game's own event sink and strategies.
+        """
+        game = self.game
+        if game is None:
+            return
+        game.events = self._events
+        for player in game.players:
+            if isinstance(player.strategy, _AttributedStrategy):
+                player.strategy = player.strategy.strategy
+        self.game = None
+        self._events = None
+
+    def record(self, hand, up_card_value, action):
+        code = ACTION_CODES.get(action)
+        if code is None or hand.tag_count >= TAG_SLOTS:
+            return
+        tags = hand.tags
+        if tags is None:
+            tags = hand.tags = array('l', bytes(TAG_SLOTS * array('l').itemsize))
+        tags[hand.tag_count] = decision_state(hand, up_card_value) * len(ACTIONS) + code
+        hand.tag_count += 1
+
+    def emit(self, kind, **data):
+        if kind == 'hand_result' or kind == 'hand_surrendered':
+            self.settle(data['hand'], data['net'])
+        elif kind == 'round_start':
+            self.rounds += 1
+        elif kind == 'hand_split':
+            hand, new_hand = data['hand'], data['new_hand']
+            if new_hand.tags is None:
+                new_hand.tags = array('l', hand.tags)
+            else:
+                new_hand.tags[:hand.tag_count] = hand.tags[:hand.tag_count]
+            new_hand.tag_count = hand.tag_count
+        elif kind == 'action_rejected':
+            # The refused decision was tagged; Game plays a fallback action instead
+            hand = data['hand']
+            if data['action'] in ACTION_CODES and hand.tag_count:
+                hand.tag_count -= 1
+
+    def settle(self, hand, net):
+        tag_count = hand.tag_count
+        if not tag_count:
+            return
+        # Doubling doubles the bet; report results per initial bet
+        value = net / (hand.bet / 2 if hand.is_double_down else hand.bet)
+        squared = value * value
+        count, total, total_squared, tags = self.count, self.total, self.total_squared, hand.tags
+        for index in range(tag_count):
+            cell = tags[index]
+            count[cell] += 1
+            total[cell] += value
+            total_squared[cell] += squared
+        hand.tag_count = 0
+
+    def merge(self, other):
+        """
+        Adds another EVAttribution into this one and returns self.
+        """
+        self.count += other.count
+        self.total += other.total
+        self.total_squared += other.total_squared
+        self.rounds += other.rounds
+        return self
+
+    def save(self, path):
+        np.savez(path, count=self.count, total=self.total, total_squared=self.total_squared,
+                 rounds=self.rounds)
+
+    @classmethod
+    def load(cls, path):
+        attribution = cls()
+        with np.load(path) as data:
+            attribution.count = data['count']
+            attribution.total = data['total']
+            attribution.total_squared = data['total_squared']
+            attribution.rounds = int(data['rounds'])
+        return attribution
+
+    def rows(self, min_count=1, confidence=0.95):
+        """
+        Yields a dict per cell seen at least min_count times: the cell's
+        kind, phase, total, up card and action, its hand count, EV per
+        initial bet with a confidence interval, and its contribution to the
+        overall EV per round.
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        for cell in np.flatnonzero(self.count >= max(min_count, 1)):
+            cell = int(cell)
+            count = self.count[cell]
+            ev = self.total[cell] / count
+            variance = max(self.total_squared[cell] / count - ev * ev, 0.0)
+            half_width = z * math.sqrt(variance / count)
+            kind, phase, total, up, action = describe_cell(cell)
+            yield {'kind': kind, 'phase': phase, 'total': total, 'up': up, 'action': action,
+                   'hands': int(count), 'ev': ev, 'ci_low': ev - half_width, 'ci_high': ev + half_width,
+                   'contribution': self.total[cell] / self.rounds if self.rounds else 0.0}
+
+    def write_csv(self, path, min_count=1, confidence=0.95):
+        """
+        Writes rows() to a CSV file.
+        """
+        with open(path, 'w', newline='') as file:
+            writer = None
+            for row in self.rows(min_count, confidence):
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+
+# Test for EV attribution
+if __name__ == "__main__":
+    import random
+    from events import NullSink
+    from game import Game
+    from players import Player, Dealer
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    attributions = []
+    for seed in (1, 2):
+        player = Player(bankroll=0, strategy=BasicStrategy(rules), name="Attributed")
+        game = Game(players=[player], dealer=Dealer(), rules=rules, compact_shoe=True, event_sink=NullSink(),
+                    rng=random.Random(seed), pool_hands=True)
+        attribution = EVAttribution().attach(game)
+        for _ in range(100000):
+            player.bankroll = 160.0
+            game.start_round()
+        attribution.detach()
+        attributions.append(attribution)
+
+    merged = attributions[0].merge(attributions[1])
+    rows = list(merged.rows(min_count=500))
+    print(f"{merged.rounds} rounds, {len(rows)} cells with 500+ hands")
+    for row in sorted(rows, key=lambda row: row['contribution'])[:5]:
+        print(f"{row['kind']} {row['total']} vs {row['up']} ({row['phase']}) {row['action']}: "
+              f"{row['hands']} hands, EV {row['ev']:+.3f} [{row['ci_low']:+.3f}, {row['ci_high']:+.3f}], "
+              f"{row['contribution']:+.4f} per round")
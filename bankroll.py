@@ -0,0 +1,241 @@
+# bankroll.py
+
+import math
+import random
+
+import numpy as np
+
+from counting import running_count
+from events import NullSink
+from game import Game
+from players import Player, Dealer
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class OutcomeDistribution:
+    """
+    A discrete distribution of per-round net results in units of the
+    initial bet, optionally joint with the true count the round was bet at.
+
+    Bankroll paths are drawn from it directly, so no game logic runs per
+    path. Rounds are treated as independent draws; with true counts this
+    ignores how counts drift within a shoe.
+    """
+
+    def __init__(self, values, probabilities, true_counts=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.probabilities = probabilities / probabilities.sum()
+        self.true_counts = None if true_counts is None else np.asarray(true_counts, dtype=np.float64)
+        self.cumulative = np.cumsum(self.probabilities)
+        self.cumulative[-1] = 1.0
+
+    @classmethod
+    def from_samples(cls, samples, true_counts=None):
+        """
+        Builds the empirical distribution of recorded per-round results.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if true_counts is None:
+            values, counts = np.unique(samples, return_counts=True)
+            return cls(values, counts)
+        pairs, counts = np.unique(np.column_stack([samples, np.floor(true_counts)]), axis=0, return_counts=True)
+        return cls(pairs[:, 0], counts, pairs[:, 1])
+
+    @classmethod
+    def from_history(cls, history, unit, seat=0):
+        """
+        Builds the distribution from a hand history (history.HandHistory),
+        summing each round's hands for one seat and dividing by unit, the
+        initial bet.
+        """
+        records = history.records
+        rounds = records['round'][records['seat'] == seat]
+        nets = records['net'][records['seat'] == seat].astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, rounds[1:] != rounds[:-1]])
+        return cls.from_samples(np.add.reduceat(nets, starts) / unit if len(nets) else nets)
+
+    @classmethod
+    def from_game(cls, rules, strategy, rounds, seed=0, count_system=None):
+        """
+        Plays rounds on a single-seat Game and returns the distribution of
+        its results, joint with the floored true count when count_system
+        is given.
+        """
+        player = Player(bankroll=0, strategy=strategy, name="Bankroll")
+        game = Game(players=[player], dealer=Dealer(), rules=rules, compact_shoe=True,
+                    event_sink=NullSink(), rng=random.Random(seed), pool_hands=True)
+        bet = game.table_limits[0]
+        count = running_count(game.shoe, count_system) if count_system is not None else None
+        nets = np.empty(rounds)
+        true_counts = np.empty(rounds) if count is not None else None
+        for index in range(rounds):
+            if count is not None:
+                true_counts[index] = count.true_count()
+            player.bankroll = bet * 16.0
+            game.start_round()
+            nets[index] = (player.bankroll - bet * 16.0) / bet
+        return cls.from_samples(nets, true_counts)
+
+    @classmethod
+    def from_moments(cls, ev, std):
+        """
+        Returns a two-point distribution with the given EV and standard
+        deviation, e.g. an EV from HouseEdgeCalculator and the usual
+        blackjack standard deviation of about 1.15.
+        """
+        return cls([ev - std, ev + std], [0.5, 0.5])
+
+    @property
+    def ev(self):
+        return float(self.values @ self.probabilities)
+
+    @property
+    def std(self):
+        return float(np.sqrt(((self.values - self.ev) ** 2) @ self.probabilities))
+
+    def sample(self, rng, size):
+        """
+        Returns the indexes of size independent draws.
+        """
+        return np.searchsorted(self.cumulative, rng.random(size), side='right')
+
+
+class BankrollResult:
+    """
+    Per-path results of simulate_paths: the round each path was ruined on
+    (-1 if never), its largest drawdown and its final bankroll.
+    """
+
+    def __init__(self, ruin_rounds, max_drawdowns, final_bankrolls, rounds):
+        self.ruin_rounds = ruin_rounds
+        self.max_drawdowns = max_drawdowns
+        self.final_bankrolls = final_bankrolls
+        self.rounds = rounds
+
+    @property
+    def paths(self):
+        return len(self.ruin_rounds)
+
+    @property
+    def ruin_probability(self):
+        return float(np.mean(self.ruin_rounds >= 0))
+
+    def time_to_ruin_quantiles(self, quantiles=DEFAULT_QUANTILES):
+        """
+        Returns {quantile: round} over the ruined paths, or {} if none were ruined.
+        """
+        ruined = self.ruin_rounds[self.ruin_rounds >= 0]
+        if not len(ruined):
+            return {}
+        return dict(zip(quantiles, np.quantile(ruined, quantiles).tolist()))
+
+    def drawdown_quantiles(self, quantiles=DEFAULT_QUANTILES):
+        return dict(zip(quantiles, np.quantile(self.max_drawdowns, quantiles).tolist()))
+
+    def final_quantiles(self, quantiles=DEFAULT_QUANTILES):
+        return dict(zip(quantiles, np.quantile(self.final_bankrolls, quantiles).tolist()))
+
+    def report(self):
+        def formatted(quantiles):
+            return ', '.join(f"{int(q * 100)}%: {value:.1f}" for q, value in quantiles.items()) or 'n/a'
+
+        return '\n'.join([
+            f"{self.paths} paths of {self.rounds} rounds",
+            f"Risk of ruin: {self.ruin_probability:.4%}",
+            f"Time to ruin (rounds): {formatted(self.time_to_ruin_quantiles())}",
+            f"Max drawdown (units): {formatted(self.drawdown_quantiles())}",
+            f"Final bankroll (units): {formatted(self.final_quantiles())}",
+        ])
+
+
+def simulate_paths(distribution, rounds, bankroll, paths=1000000, bet=1.0, bet_policy=None, seed=None,
+                   chunk_paths=250000):
+    """
+    Simulates paths bankroll trajectories of rounds rounds at once and
+    returns a BankrollResult. Amounts are in betting units.
+
+    Each round every live path draws an outcome and wins or loses it times
+    its bet. bet_policy, if given, is called as bet_policy(bankrolls,
+    true_counts) with arrays of the live paths (true_counts is None unless
+    the distribution has them) and returns their bets. A path is ruined
+    when its bankroll cannot cover its next bet. Paths are processed in
+    chunks of chunk_paths to bound memory.
+    """
+    rng = np.random.default_rng(seed)
+    ruin_rounds = np.full(paths, -1, dtype=np.int64)
+    max_drawdowns = np.zeros(paths)
+    final_bankrolls = np.zeros(paths)
+    values = distribution.values
+    true_counts = distribution.true_counts
+    for start in range(0, paths, chunk_paths):
+        stop = min(start + chunk_paths, paths)
+        balance = np.full(stop - start, float(bankroll))
+        peak = balance.copy()
+        drawdown = np.zeros(stop - start)
+        ruin = ruin_rounds[start:stop]
+        live = np.arange(stop - start)
+        for round_index in range(rounds):
+            if not len(live):
+                break
+            draws = distribution.sample(rng, len(live))
+            if bet_policy is None:
+                bets = bet
+            else:
+                counts = true_counts[draws] if true_counts is not None else None
+                bets = bet_policy(balance[live], counts)
+                # A policy may return a single bet for every path
+                bets = np.broadcast_to(np.asarray(bets, dtype=float), (len(live),))
+            # Paths that cannot cover this round's bet are ruined before it
+            broke = balance[live] < bets
+            if broke.any():
+                ruin[live[broke]] = round_index
+                keep = ~broke
+                live, draws = live[keep], draws[keep]
+                if bet_policy is not None:
+                    bets = bets[keep]
+            balance[live] += values[draws] * bets
+            np.maximum(peak, balance, out=peak)
+            np.maximum(drawdown, peak - balance, out=drawdown)
+        max_drawdowns[start:stop] = drawdown
+        final_bankrolls[start:stop] = balance
+    return BankrollResult(ruin_rounds, max_drawdowns, final_bankrolls, rounds)
+
+
+def ruin_estimate(distribution, bankroll):
+    """
+    Returns the diffusion approximation exp(-2 * ev * bankroll / variance)
+    to the risk of ruin over an unlimited number of flat-bet rounds.
+    """
+    ev, variance = distribution.ev, distribution.std ** 2
+    if ev <= 0:
+        return 1.0
+    return math.exp(-2 * ev * bankroll / variance)
+
+
+# Test for the bankroll simulator
+if __name__ == "__main__":
+    import time
+    from counting import HI_LO
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    distribution = OutcomeDistribution.from_game(rules, BasicStrategy(rules), rounds=200000, seed=3)
+    print(f"Game outcomes: EV {distribution.ev:.4f}, std {distribution.std:.4f}, "
+          f"{len(distribution.values)} distinct results")
+
+    start = time.time()
+    result = simulate_paths(distribution, rounds=1000, bankroll=50, paths=200000, seed=1)
+    print(f"Flat betting ({time.time() - start:.1f}s):\n{result.report()}")
+
+    edge = OutcomeDistribution.from_moments(0.01, 1.15)
+    result = simulate_paths(edge, rounds=20000, bankroll=100, paths=20000, seed=1)
+    print(f"1% edge: simulated risk of ruin {result.ruin_probability:.4f}, "
+          f"diffusion estimate {ruin_estimate(edge, 100):.4f}")
+
+    counted = OutcomeDistribution.from_game(rules, BasicStrategy(rules), rounds=200000, seed=3, count_system=HI_LO)
+    result = simulate_paths(counted, rounds=5000, bankroll=200, paths=20000, seed=1,
+                            bet_policy=lambda bankrolls, counts: np.clip(counts, 1, 8))
+    print(f"Hi-Lo 1-8 spread:\n{result.report()}")
@@ -0,0 +1,297 @@
+# batch.py
+
+from collections import namedtuple
+
+import numpy as np
+
+from cards import Card
+from events import OUTCOMES
+from strategy import (HIT, STAND, DOUBLE, SPLIT, SURRENDER, FIRST_TWO, SPLIT_TWO, LATER,
+                      PHASES, TOTALS, UP_CARDS)
+
+# Outcome codes for each hand slot in BatchRound.outcomes (see events.OUTCOMES)
+NO_HAND, LOSE, PUSH, WIN, BLACKJACK, SURRENDERED = range(len(OUTCOMES))
+
+ACE = Card.RANKS.index('A')
+# Card values indexed by rank index (Card.RANKS order)
+RANK_VALUES = np.array([Card.VALUES[rank] for rank in Card.RANKS], dtype=np.int16)
+HARD_VALUES = np.where(RANK_VALUES == 11, 1, RANK_VALUES).astype(np.int16)
+
+BatchRound = namedtuple('BatchRound', ['net', 'outcomes', 'player_totals', 'dealer_totals', 'hands'])
+
+
+class BatchGame:
+    """
+    Plays one seat at each of num_tables independent tables in lockstep.
+
+    Every table has its own shoe, and all per-table state (shoe buffers,
+    hand totals, soft flags, bets and outcomes) lives in NumPy arrays, so a
+    round is a fixed sequence of masked array operations instead of a Python
+    loop per table. The round flow mirrors Game: dealer peeks for blackjack,
+    the seat plays a TableStrategy including splits up to max_splits, the
+    dealer draws per Rules.dealer_hits_soft_17 and hands are settled with
+    Rules.blackjack_payout. Doubles and surrenders the rules refuse are
+    played as Game.fallback_action plays them: a hit and a stand. Bankroll
+    limits are not enforced.
+
+    A table that runs out of cards mid-round has its shoe reshuffled before
+    the next card is dealt; otherwise shoes are reshuffled at the end of the
+    round under the same 75% penetration rule as Game.check_shoe.
+    """
+
+    def __init__(self, rules, strategy, num_tables=10000, bet=10, bankroll=0.0, seed=None):
+        self.rules = rules
+        self.num_tables = num_tables
+        self.bet = bet
+        self.rng = np.random.default_rng(seed)
+        self.hard_table = np.asarray(strategy.hard, dtype=np.int8).reshape(PHASES, TOTALS, UP_CARDS)
+        self.soft_table = np.asarray(strategy.soft, dtype=np.int8).reshape(PHASES, TOTALS, UP_CARDS)
+        self.pair_table = np.asarray(strategy.pair, dtype=np.int8).reshape(PHASES, UP_CARDS, UP_CARDS)
+
+        splitting_rules = rules.splitting_rules
+        self.max_splits = splitting_rules.get('max_splits', 3)
+        self.max_hands = self.max_splits + 1
+        self.can_split_aces = splitting_rules.get('can_split_aces', True)
+        self.resplit_aces = splitting_rules.get('resplit_aces_allowed', False)
+        self.split_unlike_tens = splitting_rules.get('can_split_unlike_tens', False)
+        self.can_surrender = rules.surrender_allowed != 'none'
+        self.double_totals = np.zeros(TOTALS, dtype=bool)
+        self.double_totals[[total for total in rules.double_down_allowed_on if total < TOTALS]] = True
+
+        self.shoe_size = 52 * rules.number_of_decks
+        deck = np.tile(np.arange(len(Card.RANKS), dtype=np.int8), len(Card.SUITS) * rules.number_of_decks)
+        self.shoes = self.rng.permuted(np.tile(deck, (num_tables, 1)), axis=1)
+        self.positions = np.zeros(num_tables, dtype=np.int64)
+        self.bankrolls = np.full(num_tables, bankroll, dtype=np.float64)
+        self.current_round = 0
+
+        shape = (num_tables, self.max_hands)
+        self.hard = np.zeros(shape, dtype=np.int16)
+        self.aces = np.zeros(shape, dtype=np.int16)
+        self.card_counts = np.zeros(shape, dtype=np.int16)
+        self.first_ranks = np.zeros(shape, dtype=np.int8)
+        self.second_ranks = np.zeros(shape, dtype=np.int8)
+        self.bets = np.zeros(shape, dtype=np.float64)
+        self.done = np.zeros(shape, dtype=bool)
+        self.surrendered = np.zeros(shape, dtype=bool)
+        self.hand_counts = np.zeros(num_tables, dtype=np.int16)
+
+    def reshuffle(self, tables):
+        """
+        Reshuffles the shoes of the given tables in place.
+        """
+        self.shoes[tables] = self.rng.permuted(self.shoes[tables], axis=1)
+        self.positions[tables] = 0
+
+    def deal(self, tables):
+        """
+        Deals one card to each of the given (distinct) tables and returns their rank indexes.
+        """
+        exhausted = self.positions[tables] >= self.shoe_size
+        if exhausted.any():
+            self.reshuffle(tables[exhausted])
+        positions = self.positions[tables]
+        self.positions[tables] = positions + 1
+        return self.shoes[tables, positions]
+
+    def _add_card(self, tables, slots, ranks):
+        self.hard[tables, slots] += HARD_VALUES[ranks]
+        self.aces[tables, slots] += ranks == ACE
+        self.card_counts[tables, slots] += 1
+
+    def _best_values(self, hard, aces):
+        soft = (aces > 0) & (hard <= 11)
+        return np.where(soft, hard + 10, hard), soft
+
+    def play_round(self):
+        """
+        Plays one round at every table and returns a BatchRound of per-table arrays.
+        """
+        self.current_round += 1
+        n = self.num_tables
+        tables = np.arange(n)
+        zero = np.zeros(n, dtype=np.intp)
+        for array in (self.hard, self.aces, self.card_counts, self.bets):
+            array.fill(0)
+        self.done.fill(False)
+        self.surrendered.fill(False)
+        self.hand_counts.fill(1)
+        self.bets[:, 0] = self.bet
+
+        # Two cards to the seat, then two to the dealer, as in Game.deal_initial_cards
+        self.first_ranks[:, 0] = self.deal(tables)
+        self.second_ranks[:, 0] = self.deal(tables)
+        self._add_card(tables, zero, self.first_ranks[:, 0])
+        self._add_card(tables, zero, self.second_ranks[:, 0])
+        up_ranks = self.deal(tables)
+        hole_ranks = self.deal(tables)
+        up_values = RANK_VALUES[up_ranks]
+        dealer_hard = HARD_VALUES[up_ranks] + HARD_VALUES[hole_ranks]
+        dealer_aces = (up_ranks == ACE).astype(np.int16) + (hole_ranks == ACE)
+
+        player_best, _ = self._best_values(self.hard[:, 0], self.aces[:, 0])
+        dealer_best, _ = self._best_values(dealer_hard, dealer_aces)
+        player_blackjack = player_best == 21
+        dealer_blackjack = dealer_best == 21
+        round_over = player_blackjack | dealer_blackjack
+        self.done[:, 0] = round_over
+
+        for slot in range(self.max_hands):
+            self._play_slot(slot, up_values)
+
+        # The dealer plays out unless the round ended on a natural
+        drawing = ~round_over
+        while True:
+            dealer_best, dealer_soft = self._best_values(dealer_hard, dealer_aces)
+            must_hit = drawing & (dealer_best < 17)
+            if self.rules.dealer_hits_soft_17:
+                must_hit |= drawing & (dealer_best == 17) & dealer_soft
+            hitting = np.nonzero(must_hit)[0]
+            if not len(hitting):
+                break
+            ranks = self.deal(hitting)
+            dealer_hard[hitting] += HARD_VALUES[ranks]
+            dealer_aces[hitting] += ranks == ACE
+
+        result = self._settle(player_blackjack, dealer_blackjack, dealer_best)
+
+        low = np.nonzero(self.shoe_size - self.positions < self.shoe_size * 0.25)[0]
+        if len(low):
+            self.reshuffle(low)
+        return result
+
+    def play(self, num_rounds):
+        """
+        Plays num_rounds rounds and returns the net results as a (num_rounds, num_tables) array.
+        """
+        net = np.empty((num_rounds, self.num_tables), dtype=np.float64)
+        for round_index in range(num_rounds):
+            net[round_index] = self.play_round().net
+        return net
+
+    def _play_slot(self, slot, up_values):
+        while True:
+            tables = np.nonzero((self.hand_counts > slot) & ~self.done[:, slot])[0]
+            if not len(tables):
+                return
+            slots = np.full(len(tables), slot, dtype=np.intp)
+            hard = self.hard[tables, slot]
+            aces = self.aces[tables, slot]
+            counts = self.card_counts[tables, slot]
+            up = up_values[tables]
+            best, soft = self._best_values(hard, aces)
+            split_hand = self.hand_counts[tables] > 1
+            two_cards = counts == 2
+            phase = np.where(two_cards, np.where(split_hand, SPLIT_TWO, FIRST_TWO), LATER)
+
+            actions = np.where(soft, self.soft_table[phase, best, up], self.hard_table[phase, best, up])
+            first = self.first_ranks[tables, slot]
+            second = self.second_ranks[tables, slot]
+            pair_values = RANK_VALUES[first]
+            splittable = two_cards & (self.hand_counts[tables] <= self.max_splits)
+            if self.split_unlike_tens:
+                splittable &= (first == second) | ((pair_values == 10) & (RANK_VALUES[second] == 10))
+            else:
+                splittable &= first == second
+            if not self.can_split_aces:
+                splittable &= first != ACE
+            elif not self.resplit_aces:
+                splittable &= (first != ACE) | ~split_hand
+            splitting = splittable & (self.pair_table[phase, pair_values, up] == SPLIT)
+            actions = np.where(splitting, SPLIT, actions)
+            # Mask actions the rules refuse, as Game.apply_action does
+            can_double = two_cards & self.double_totals[best]
+            if not self.rules.double_after_split_allowed:
+                can_double &= ~split_hand
+            actions = np.where((actions == DOUBLE) & ~can_double, HIT, actions)
+            refused = actions == SURRENDER
+            if self.can_surrender:
+                refused &= phase != FIRST_TWO
+            actions = np.where(refused, STAND, actions)
+
+            stand = tables[actions == STAND]
+            self.done[stand, slot] = True
+
+            surrender = tables[actions == SURRENDER]
+            self.surrendered[surrender, slot] = True
+            self.done[surrender, slot] = True
+
+            double = tables[actions == DOUBLE]
+            if len(double):
+                self.bets[double, slot] *= 2
+                self._add_card(double, slots[:len(double)], self.deal(double))
+                self.done[double, slot] = True
+
+            hit = tables[actions == HIT]
+            if len(hit):
+                self._add_card(hit, slots[:len(hit)], self.deal(hit))
+                best, _ = self._best_values(self.hard[hit, slot], self.aces[hit, slot])
+                self.done[hit[best > 21], slot] = True
+
+            split = tables[actions == SPLIT]
+            if len(split):
+                self._split(split, slot)
+
+    def _split(self, tables, slot):
+        new_slots = self.hand_counts[tables].astype(np.intp)
+        slots = np.full(len(tables), slot, dtype=np.intp)
+        moved = self.second_ranks[tables, slot]
+        self.hard[tables, slot] -= HARD_VALUES[moved]
+        self.aces[tables, slot] -= moved == ACE
+        self.card_counts[tables, slot] = 1
+        self.first_ranks[tables, new_slots] = moved
+        self.hard[tables, new_slots] = HARD_VALUES[moved]
+        self.aces[tables, new_slots] = moved == ACE
+        self.card_counts[tables, new_slots] = 1
+        self.bets[tables, new_slots] = self.bets[tables, slot]
+        self.done[tables, new_slots] = False
+        self.surrendered[tables, new_slots] = False
+        self.hand_counts[tables] += 1
+        # Game deals to the original hand first, then to the new one
+        ranks = self.deal(tables)
+        self.second_ranks[tables, slot] = ranks
+        self._add_card(tables, slots, ranks)
+        ranks = self.deal(tables)
+        self.second_ranks[tables, new_slots] = ranks
+        self._add_card(tables, new_slots, ranks)
+
+    def _settle(self, player_blackjack, dealer_blackjack, dealer_best):
+        present = np.arange(self.max_hands) < self.hand_counts[:, None]
+        player_best, _ = self._best_values(self.hard, self.aces)
+        dealer = dealer_best[:, None]
+        bets = self.bets
+
+        outcomes = np.select(
+            [~present,
+             dealer_blackjack[:, None] & player_blackjack[:, None],
+             dealer_blackjack[:, None],
+             player_blackjack[:, None],
+             self.surrendered,
+             player_best > 21,
+             (dealer > 21) | (player_best > dealer),
+             player_best == dealer],
+            [NO_HAND, PUSH, LOSE, BLACKJACK, SURRENDERED, LOSE, WIN, PUSH],
+            default=LOSE).astype(np.int8)
+        # Outcome codes index the net payout per unit bet
+        payouts = np.array([0.0, -1.0, 0.0, 1.0, self.rules.blackjack_payout, -0.5])
+        net = (payouts[outcomes] * bets).sum(axis=1)
+        self.bankrolls += net
+        player_best[~present] = 0
+        return BatchRound(net, outcomes, player_best, dealer_best, self.hand_counts.copy())
+
+
+# Test for BatchGame class
+if __name__ == "__main__":
+    from rules import Rules
+    from strategy import TableStrategy, NO_SPLIT
+
+    def hit_below_17(kind, phase, total, up):
+        if kind == 'pair':
+            return NO_SPLIT
+        return HIT if total < 17 else STAND
+
+    rules = Rules()
+    batch = BatchGame(rules, TableStrategy.from_function(hit_below_17), num_tables=10000, seed=1)
+    net = batch.play(100)
+    print(f"Rounds played: {net.size}")  # Output: 1000000
+    print(f"EV per initial bet: {net.mean() / batch.bet:.4f}")
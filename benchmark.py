@@ -0,0 +1,232 @@
+# benchmark.py
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from events import NullSink
+from game import Game
+from players import Player, Dealer
+from rules import Rules
+from strategy import Strategy, STRATEGIES, make_strategy
+
+DEFAULT_MATRIX = {
+    'decks': (1, 2, 6, 8),
+    'h17': (False, True),
+    'strategy': STRATEGIES,
+    'seats': (1, 7),
+    'workers': (1, os.cpu_count() or 1),
+}
+QUICK_MATRIX = {
+    'decks': (1, 6),
+    'h17': (False,),
+    'strategy': STRATEGIES,
+    'seats': (1, 7),
+    'workers': (1,),
+}
+MEMORY_ROUNDS = 2000
+
+
+class TimedStrategy(Strategy):
+    """
+    Wraps a strategy and accumulates the number of decisions and the time spent making them.
+    """
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.decisions = 0
+        self.elapsed_ns = 0
+
+    def decide_action(self, hand, dealer_up_card, rules):
+        start = time.perf_counter_ns()
+        action = self.strategy.decide_action(hand, dealer_up_card, rules)
+        self.elapsed_ns += time.perf_counter_ns() - start
+        self.decisions += 1
+        return action
+
+
+def workload_name(config):
+    return (f"decks={config['decks']}/{'H17' if config['h17'] else 'S17'}/{config['strategy']}"
+            f"/seats={config['seats']}/workers={config['workers']}")
+
+
+def make_game(config, seed, wrap=None):
+    rules = Rules(number_of_decks=config['decks'], dealer_hits_soft_17=config['h17'])
+    strategy = make_strategy(config['strategy'], rules)
+    players = [Player(bankroll=0, strategy=wrap(strategy) if wrap else strategy, name=f"Seat_{seat}")
+               for seat in range(config['seats'])]
+    game = Game(players=players, dealer=Dealer(), rules=rules, compact_shoe=True,
+                event_sink=NullSink(), rng=random.Random(seed))
+    # Seven seats can run a single deck dry mid-round
+    game.shoe.reshuffle_when_empty = True
+    return game
+
+
+def play(game, rounds):
+    """
+    Plays rounds on game, keeping every seat funded, and returns the elapsed seconds.
+    """
+    players = game.players
+    bankroll = game.table_limits[0] * 16.0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for player in players:
+            player.bankroll = bankroll
+        game.start_round()
+    return time.perf_counter() - start
+
+
+def _play_chunk(args):
+    config, rounds, seed = args
+    return play(make_game(config, seed), rounds)
+
+
+def run_workload(config, rounds, seed):
+    """
+    Measures one workload and returns its result dict.
+    """
+    # Build any cached strategy tables before timing
+    make_strategy(config['strategy'], Rules(number_of_decks=config['decks'],
+                                            dealer_hits_soft_17=config['h17']))
+    workers = config['workers']
+    if workers == 1:
+        elapsed = play(make_game(config, seed), rounds)
+    else:
+        chunks = [(config, rounds // workers, seed + worker) for worker in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_play_chunk, [(config, 1, seed)] * workers))  # start the workers
+            start = time.perf_counter()
+            list(executor.map(_play_chunk, chunks))
+            elapsed = time.perf_counter() - start
+        rounds = sum(chunk[1] for chunk in chunks)
+
+    timed = []
+    game = make_game(config, seed, wrap=lambda strategy: timed.append(TimedStrategy(strategy)) or timed[-1])
+    play(game, max(rounds // (5 * workers), 1))
+    decisions = sum(strategy.decisions for strategy in timed)
+    decision_ns = sum(strategy.elapsed_ns for strategy in timed)
+
+    tracemalloc.start()
+    play(make_game(config, seed), min(rounds, MEMORY_ROUNDS))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'name': workload_name(config),
+        'config': config,
+        'seed': seed,
+        'rounds': rounds,
+        'seconds': elapsed,
+        'rounds_per_sec': rounds / elapsed,
+        'ns_per_decision': decision_ns / decisions if decisions else None,
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_matrix(matrix, rounds, seed, log=None):
+    keys = list(matrix)
+    results = []
+    for values in itertools.product(*(matrix[key] for key in keys)):
+        config = dict(zip(keys, values))
+        result = run_workload(config, rounds, seed)
+        results.append(result)
+        if log:
+            log(f"{result['name']}: {result['rounds_per_sec']:.0f} rounds/s, "
+                f"{result['ns_per_decision'] or 0:.0f} ns/decision, "
+                f"{result['peak_memory_bytes'] / 1024:.0f} KiB peak")
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rounds': rounds,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Returns a list of regression messages for workloads that got slower or
+    hungrier than the baseline by more than threshold (a fraction).
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        checks = (
+            ('rounds_per_sec', old['rounds_per_sec'], result['rounds_per_sec'], False),
+            ('ns_per_decision', old['ns_per_decision'], result['ns_per_decision'], True),
+            ('peak_memory_bytes', old['peak_memory_bytes'], result['peak_memory_bytes'], True),
+        )
+        for metric, before, after, higher_is_worse in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change > threshold) if higher_is_worse else (change < -threshold):
+                regressions.append(f"{result['name']}: {metric} {before:.4g} -> {after:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Game throughput across rules, strategies and table sizes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the benchmark matrix")
+    run.add_argument('--output', default='benchmark.json', help="where to write the JSON results")
+    run.add_argument('--rounds', type=int, default=20000, help="rounds per workload")
+    run.add_argument('--seed', type=int, default=12345)
+    run.add_argument('--quick', action='store_true', help="run a reduced matrix")
+    run.add_argument('--decks', type=int, nargs='+')
+    run.add_argument('--seats', type=int, nargs='+')
+    run.add_argument('--strategies', nargs='+', choices=STRATEGIES)
+    run.add_argument('--workers', type=int, nargs='+')
+    run.add_argument('--baseline', help="compare against this results file after running")
+    run.add_argument('--threshold', type=float, default=0.10)
+
+    check = commands.add_parser('compare', help="compare two results files")
+    check.add_argument('baseline')
+    check.add_argument('current')
+    check.add_argument('--threshold', type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        matrix = dict(QUICK_MATRIX if args.quick else DEFAULT_MATRIX)
+        for key, value in (('decks', args.decks), ('seats', args.seats),
+                           ('strategy', args.strategies), ('workers', args.workers)):
+            if value:
+                matrix[key] = tuple(value)
+        current = run_matrix(matrix, args.rounds, args.seed, log=print)
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Results written to {args.output}")
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+
+    regressions = compare(baseline, current, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print("No regressions.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
+import math
 import random
+from array import array
 
 class Card:
     """
     Represents a single playing card in Blackjack.
     """
+    __slots__ = ('rank', 'suit')
     RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10',
              'J', 'Q', 'K', 'A']
     SUITS = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
@@ -27,23 +30,158 @@ class Card:
     def get_value(self):
         return self.VALUES[self.rank]
 
+    @staticmethod
+    def from_code(code):
+        """
+        Returns the interned Card for a card code (suit index * 13 + rank index).
+        """
+        return CARD_VIEWS[code]
+
+
+# Interned flyweight cards, one per card code. Compact shoes hand these out
+# instead of building new Card objects.
+CARD_VIEWS = tuple(Card(rank, suit) for suit in Card.SUITS for rank in Card.RANKS)
+CARD_CODES = {(card.rank, card.suit): code for code, card in enumerate(CARD_VIEWS)}
+
+# Shoe compositions count cards by value: index 0 is Aces, 1-8 are 2-9 and
+# 9 is all ten-valued cards.
+COMPOSITION_SIZE = 10
+COMPOSITION_INDEX = {rank: (0 if value == 11 else value - 1) for rank, value in Card.VALUES.items()}
+
+
+def count_composition(cards):
+    counts = [0] * COMPOSITION_SIZE
+    for card in cards:
+        counts[COMPOSITION_INDEX[card.rank]] += 1
+    return tuple(counts)
+
+
+def place_cut_card(size, penetration, cut_card=None, spread=0, rng=random):
+    """
+    Returns how many of size cards are dealt before the cut card: cut_card
+    if given, else penetration of the shoe, moved by up to spread cards
+    either way at random.
+    """
+    position = cut_card if cut_card is not None else round(size * penetration)
+    if spread:
+        position += rng.randint(-spread, spread)
+    return min(max(position, 0), size)
+
 
 class Deck:
     """
     Represents a standard deck of 52 playing cards.
+
+    Shuffles use rng, a random.Random instance, or the global random module
+    when none is given. The cut card goes after penetration of the cards
+    (or after cut_card cards), moved by up to cut_card_spread cards at each
+    shuffle; once it has come out, needs_shuffle() is true.
     """
 
-    def __init__(self):
-        self.cards = [Card(rank, suit) for suit in Card.SUITS for rank in Card.RANKS]
+    # When True, running out mid-round shuffles the discards back in instead
+    # of raising; see reshuffle_discards
+    reshuffle_when_empty = False
+
+    def __init__(self, rng=None, penetration=0.75, cut_card=None, cut_card_spread=0):
+        self.rng = rng if rng is not None else random
+        self.penetration = penetration
+        self.cut_card = cut_card
+        self.cut_card_spread = cut_card_spread
+        # Running counts by system name; see counting.running_count
+        self.counts = {}
+        # Built once; reshuffles copy these instead of creating new cards
+        self.all_cards = tuple(self.build_cards())
+        self.cards = list(self.all_cards)
+        # Cards dealt this round, which stay on the table if the discards are reshuffled
+        self.in_play = []
         self.shuffle()
+        self.cut_position = place_cut_card(len(self.all_cards), penetration, cut_card, cut_card_spread, self.rng)
+
+    def build_cards(self):
+        return [Card(rank, suit) for suit in Card.SUITS for rank in Card.RANKS]
 
     def shuffle(self):
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
+
+    def reshuffle(self):
+        """
+        Returns every card to the deck and shuffles it.
+        """
+        self.cards = list(self.all_cards)
+        self.in_play = []
+        self.shuffle()
+        self.cut_position = place_cut_card(len(self.all_cards), self.penetration, self.cut_card,
+                                           self.cut_card_spread, self.rng)
+        for count in self.counts.values():
+            count.reset()
+
+    def reshuffle_discards(self):
+        """
+        Shuffles the discards back in when the deck runs out mid-round,
+        leaving the cards dealt this round on the table. The counts restart
+        from those cards, and the whole deck is reshuffled after the round.
+        """
+        on_table = {}
+        for card in self.in_play:
+            code = CARD_CODES[card.rank, card.suit]
+            on_table[code] = on_table.get(code, 0) + 1
+        discards = []
+        for card in self.all_cards:
+            code = CARD_CODES[card.rank, card.suit]
+            if on_table.get(code):
+                on_table[code] -= 1
+            else:
+                discards.append(card)
+        if not discards:
+            raise IndexError("No more cards in the deck; every card is on the table.")
+        self.cards = discards
+        self.shuffle()
+        self.cut_position = -1
+        for count in self.counts.values():
+            count.reset()
+            for card in self.in_play:
+                count.running += count.by_rank[card.rank]
+
+    def needs_shuffle(self):
+        """
+        Returns True once the cut card has come out.
+        """
+        return len(self.all_cards) - len(self.cards) > self.cut_position
+
+    def end_round(self):
+        # Discards stay out until the next reshuffle
+        self.in_play = []
+
+    def getstate(self):
+        """
+        Returns the order of the undealt cards and the cut card as JSON-ready data.
+        """
+        return {'cards': [CARD_CODES[card.rank, card.suit] for card in self.cards],
+                'cut_position': self.cut_position}
+
+    def setstate(self, state):
+        self.cards = [CARD_VIEWS[code] for code in state['cards']]
+        self.cut_position = state['cut_position']
 
     def deal_card(self):
         if not self.cards:
-            raise IndexError("No more cards in the deck.")
-        return self.cards.pop()
+            if not self.reshuffle_when_empty:
+                raise IndexError("No more cards in the deck.")
+            self.reshuffle_discards()
+        card = self.cards.pop()
+        self.in_play.append(card)
+        for count in self.counts.values():
+            count.running += count.by_rank[card.rank]
+        return card
+
+    def cards_remaining(self):
+        return len(self.cards)
+
+    def composition(self):
+        """
+        Returns the undealt cards counted by value (see COMPOSITION_INDEX).
+        """
+        return count_composition(self.cards)
 
 
 class Shoe(Deck):
@@ -51,13 +189,259 @@ class Shoe(Deck):
     Represents a shoe containing multiple decks.
     """
 
-    def __init__(self, number_of_decks=6):
+    def __init__(self, number_of_decks=6, rng=None, penetration=0.75, cut_card=None, cut_card_spread=0):
         self.number_of_decks = number_of_decks
-        self.cards = [Card(rank, suit)
-                      for _ in range(number_of_decks)
-                      for suit in Card.SUITS
-                      for rank in Card.RANKS]
+        super().__init__(rng=rng, penetration=penetration, cut_card=cut_card, cut_card_spread=cut_card_spread)
+
+    def build_cards(self):
+        return [Card(rank, suit)
+                for _ in range(self.number_of_decks)
+                for suit in Card.SUITS
+                for rank in Card.RANKS]
+
+
+class CompactShoe:
+    """
+    A shoe that stores card codes in a compact array instead of Card objects.
+
+    Dealing advances a cursor through the buffer and reshuffling permutes the
+    same buffer in place. Dealt cards are the interned views in CARD_VIEWS,
+    so they behave like regular Card objects for Hand, Dealer and Game.
+    The cut card is placed as for Deck.
+    """
+
+    reshuffle_when_empty = False
+
+    def __init__(self, number_of_decks=6, rng=None, penetration=0.75, cut_card=None, cut_card_spread=0):
+        self.number_of_decks = number_of_decks
+        self.rng = rng if rng is not None else random
+        self.penetration = penetration
+        self.cut_card = cut_card
+        self.cut_card_spread = cut_card_spread
+        self.codes = array('B', range(len(CARD_VIEWS))) * number_of_decks
+        self.position = 0
+        # Cursor at the start of the round; codes before it are the discards
+        self.round_start = 0
+        self.counts = {}
         self.shuffle()
+        self.cut_position = place_cut_card(len(self.codes), penetration, cut_card, cut_card_spread, self.rng)
+
+    @property
+    def cards(self):
+        """
+        The undealt cards, ordered so that the next card to be dealt is last.
+        """
+        return [CARD_VIEWS[code] for code in reversed(self.codes[self.position:])]
+
+    def shuffle(self):
+        remaining = self.codes[self.position:]
+        self.rng.shuffle(remaining)
+        self.codes[self.position:] = remaining
+
+    def reshuffle(self):
+        """
+        Returns every card to the shoe and shuffles the buffer in place.
+        """
+        self.position = self.round_start = 0
+        self.rng.shuffle(self.codes)
+        self.cut_position = place_cut_card(len(self.codes), self.penetration, self.cut_card,
+                                           self.cut_card_spread, self.rng)
+        for count in self.counts.values():
+            count.reset()
+
+    def reshuffle_discards(self):
+        """
+        Shuffles the discards back in when the shoe runs out mid-round, as
+        for Deck. The round's cards move to the front of the buffer and the
+        shuffled discards follow them.
+        """
+        discards = self.codes[:self.round_start]
+        if not discards:
+            raise IndexError("No more cards in the shoe; every card is on the table.")
+        self.rng.shuffle(discards)
+        in_play = self.codes[self.round_start:]
+        self.codes[:] = in_play + discards
+        self.position = len(in_play)
+        self.round_start = 0
+        self.cut_position = -1
+        for count in self.counts.values():
+            count.reset()
+            for code in in_play:
+                count.running += count.by_code[code]
+
+    def deal_card(self):
+        position = self.position
+        if position >= len(self.codes):
+            if not self.reshuffle_when_empty:
+                raise IndexError("No more cards in the shoe.")
+            self.reshuffle_discards()
+            position = self.position
+        self.position = position + 1
+        code = self.codes[position]
+        for count in self.counts.values():
+            count.running += count.by_code[code]
+        return CARD_VIEWS[code]
+
+    def cards_remaining(self):
+        return len(self.codes) - self.position
+
+    def composition(self):
+        """
+        Returns the undealt cards counted by value (see COMPOSITION_INDEX).
+        """
+        return count_composition(CARD_VIEWS[code] for code in self.codes[self.position:])
+
+    def needs_shuffle(self):
+        """
+        Returns True once the cut card has come out.
+        """
+        return self.position > self.cut_position
+
+    def end_round(self):
+        # Discards stay out until the next reshuffle
+        self.round_start = self.position
+
+    def getstate(self):
+        """
+        Returns the buffer, cursor and cut card as JSON-ready data.
+        """
+        # The dealt part matters too: reshuffle() permutes the whole buffer
+        return {'codes': self.codes.tolist(), 'position': self.position, 'cut_position': self.cut_position}
+
+    def setstate(self, state):
+        self.codes = array('B', state['codes'])
+        self.position = self.round_start = state['position']
+        self.cut_position = state['cut_position']
+
+
+class ContinuousShuffler:
+    """
+    A continuous shuffling machine: every card dealt is drawn at random from
+    the cards still in the machine, and the round's discards go back in at
+    the end of each round, so the shoe is never reshuffled as a whole.
+
+    Card codes live in one buffer. Dealt codes are swapped to the front, so
+    each draw is one random index and one swap, and returning the discards
+    just moves the cursor back to the start.
+    """
+
+    reshuffle_when_empty = False
+
+    def __init__(self, number_of_decks=6, rng=None):
+        self.number_of_decks = number_of_decks
+        self.rng = rng if rng is not None else random
+        self.codes = array('B', range(len(CARD_VIEWS))) * number_of_decks
+        self.position = 0
+        self.counts = {}
+
+    def shuffle(self):
+        # Every draw is already uniform over the cards in the machine
+        pass
+
+    def reshuffle(self):
+        """
+        Returns every dealt card to the machine.
+        """
+        self._return_cards()
+
+    def _return_cards(self):
+        self.position = 0
+        for count in self.counts.values():
+            count.reset()
+
+    def deal_card(self):
+        codes = self.codes
+        position = self.position
+        if position >= len(codes):
+            # The discards go back every round, so there are none to reshuffle
+            raise IndexError("No more cards in the shuffler; every card is on the table.")
+        index = self.rng.randrange(position, len(codes))
+        code = codes[index]
+        codes[index] = codes[position]
+        codes[position] = code
+        self.position = position + 1
+        for count in self.counts.values():
+            count.running += count.by_code[code]
+        return CARD_VIEWS[code]
+
+    def cards_remaining(self):
+        return len(self.codes) - self.position
+
+    def composition(self):
+        """
+        Returns the cards in the machine counted by value (see COMPOSITION_INDEX).
+        """
+        return count_composition(CARD_VIEWS[code] for code in self.codes[self.position:])
+
+    def needs_shuffle(self):
+        return False
+
+    def end_round(self):
+        # The round's discards go straight back into the machine; this is not a
+        # reshuffle, so it bypasses reshuffle() and anything wrapping it
+        self._return_cards()
+
+    def getstate(self):
+        """
+        Returns the buffer and cursor as JSON-ready data.
+        """
+        return {'codes': self.codes.tolist(), 'position': self.position}
+
+    def setstate(self, state):
+        self.codes = array('B', state['codes'])
+        self.position = state['position']
+
+
+class InfiniteShoe:
+    """
+    An infinite-deck shoe: every card is drawn independently with the
+    probabilities of a single deck, so the composition never changes.
+
+    cards_remaining() is infinite, which makes true counts zero.
+    number_of_decks only scales composition().
+    """
+
+    reshuffle_when_empty = False
+
+    def __init__(self, number_of_decks=6, rng=None):
+        self.number_of_decks = number_of_decks
+        self.rng = rng if rng is not None else random
+        self.counts = {}
+
+    def shuffle(self):
+        pass
+
+    def reshuffle(self):
+        for count in self.counts.values():
+            count.reset()
+
+    def deal_card(self):
+        code = int(self.rng.random() * len(CARD_VIEWS))
+        for count in self.counts.values():
+            count.running += count.by_code[code]
+        return CARD_VIEWS[code]
+
+    def cards_remaining(self):
+        return math.inf
+
+    def composition(self):
+        """
+        Returns number_of_decks decks counted by value (see COMPOSITION_INDEX).
+        """
+        return tuple(count * self.number_of_decks for count in count_composition(CARD_VIEWS))
+
+    def needs_shuffle(self):
+        return False
+
+    def end_round(self):
+        pass
+
+    def getstate(self):
+        # Draws depend only on the rng
+        return {}
+
+    def setstate(self, state):
+        pass
 
 
 
@@ -82,3 +466,17 @@ if __name__ == "__main__":
     card = shoe.deal_card()
     print(f"Dealt card: {card}")
     print(f"Cards left in shoe: {len(shoe.cards)}")  # Output: 311
+
+    compact_shoe = CompactShoe(number_of_decks=6)
+    card = compact_shoe.deal_card()
+    print(f"Dealt card: {card}")
+    print(f"Cards left in compact shoe: {compact_shoe.cards_remaining()}")  # Output: 311
+
+    shuffler = ContinuousShuffler(number_of_decks=6)
+    hand = [shuffler.deal_card() for _ in range(5)]
+    print(f"Cards left in shuffler: {shuffler.cards_remaining()}")  # Output: 307
+    shuffler.end_round()
+    print(f"Cards left after the discards go back: {shuffler.cards_remaining()}")  # Output: 312
+
+    cut_shoe = Shoe(number_of_decks=6, penetration=0.5, cut_card_spread=10)
+    print(f"Cut card after {cut_shoe.cut_position} of {len(cut_shoe.cards)} cards")  # Output: 146-166 of 312
@@ -0,0 +1,152 @@
+# checkpoint.py
+
+import json
+import os
+import time
+
+from simulation import RunningStats, chunk_game, play_rounds
+from strategy import strategy_key
+
+CHECKPOINT_VERSION = 1
+
+
+def rng_state(rng):
+    """
+    Returns random.Random state as JSON-ready data.
+    """
+    version, internal, gauss_next = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def set_rng_state(rng, state):
+    version, internal, gauss_next = state
+    rng.setstate((version, tuple(internal), gauss_next))
+
+
+def game_state(game):
+    """
+    Returns the state of a Game between rounds as JSON-ready data: the
+    round number, bankrolls, shoe order and cursor, shoe rng and running
+    counts.
+    """
+    shoe = game.shoe
+    return {
+        'round': game.current_round,
+        'bankrolls': [player.bankroll for player in game.players],
+        'shoe': shoe.getstate(),
+        'rng': rng_state(shoe.rng),
+        'counts': {name: count.running for name, count in shoe.counts.items()},
+    }
+
+
+def restore_game(game, state):
+    """
+    Puts a Game set up like the one state was taken from (same seats, shoe
+    type and attached counts) back into that state.
+    """
+    if len(state['bankrolls']) != len(game.players):
+        raise ValueError(f"Checkpoint has {len(state['bankrolls'])} seats but the game has {len(game.players)}.")
+    shoe = game.shoe
+    for name in state['counts']:
+        if name not in shoe.counts:
+            raise ValueError(f"Checkpoint has a {name} count that the game does not track.")
+    game.current_round = state['round']
+    for player, bankroll in zip(game.players, state['bankrolls']):
+        player.bankroll = bankroll
+    shoe.setstate(state['shoe'])
+    set_rng_state(shoe.rng, state['rng'])
+    for name, running in state['counts'].items():
+        shoe.counts[name].running = running
+
+
+def save_checkpoint(path, data):
+    """
+    Writes data to path atomically, so a crash leaves either the previous
+    checkpoint or the new one.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump(data, file, separators=(',', ':'))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    """
+    Returns the checkpoint data at path, or None if there is none.
+    """
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    if data.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a version {CHECKPOINT_VERSION} checkpoint.")
+    return data
+
+
+def run_checkpointed(rules, strategy, rounds, path, seed=0, interval=5.0, count_system=None, bet_policy=None,
+                     shoe=None, check_rounds=1000):
+    """
+    Plays the same rounds as run_chunk(rules, strategy, rounds, seed, 0)
+    and returns the RunningStats, saving a checkpoint to path at most every
+    interval seconds and once at the end.
+
+    If path holds a checkpoint of the same run, play resumes from it and
+    the result is bit-identical to an uninterrupted run; a finished run can
+    be extended by resuming with more rounds. bet_policy and shoe must be
+    the same as when the checkpoint was written. The clock is only read
+    every check_rounds rounds.
+    """
+    run = {'rules': rules.stable_hash(), 'strategy': strategy_key(strategy), 'seed': seed,
+           'count_system': count_system.name if count_system is not None else None}
+    checkpoint = load_checkpoint(path)
+    if checkpoint is not None and checkpoint['run'] != run:
+        raise ValueError(f"{path} is a checkpoint of a different run.")
+
+    stats = RunningStats.from_dict(checkpoint['stats']) if checkpoint is not None else RunningStats()
+    game = chunk_game(rules, strategy, seed, 0, stats, count_system=count_system, bet_policy=bet_policy, shoe=shoe)
+    if checkpoint is not None:
+        restore_game(game, checkpoint['game'])
+
+    def save():
+        save_checkpoint(path, {'version': CHECKPOINT_VERSION, 'run': run, 'stats': stats.to_dict(),
+                               'game': game_state(game)})
+
+    last_save = time.monotonic()
+    while stats.rounds < rounds:
+        play_rounds(game, stats, min(check_rounds, rounds - stats.rounds), count_system)
+        if time.monotonic() - last_save >= interval:
+            save()
+            last_save = time.monotonic()
+    save()
+    return stats
+
+
+# Test for checkpoint and resume
+if __name__ == "__main__":
+    import tempfile
+    from counting import HI_LO, BetSpread
+    from rules import Rules
+    from simulation import run_chunk
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    spread = BetSpread(HI_LO, {2: 2, 3: 4, 4: 8})
+    start = time.time()
+    expected = run_chunk(rules, BasicStrategy(), 100000, 5, 0, count_system=HI_LO, bet_policy=spread)
+    print(f"Uninterrupted: {expected} ({time.time() - start:.2f}s)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.json')
+        start = time.time()
+        # Stop halfway, then resume from the checkpoint in a fresh game
+        run_checkpointed(rules, BasicStrategy(), 50000, path, seed=5, interval=0.0, count_system=HI_LO,
+                         bet_policy=spread)
+        resumed = run_checkpointed(rules, BasicStrategy(), 100000, path, seed=5, interval=0.0,
+                                   count_system=HI_LO, bet_policy=spread)
+        print(f"Resumed:       {resumed} ({time.time() - start:.2f}s, checkpoint every 1000 rounds, "
+              f"{os.path.getsize(path)} bytes)")
+    print(f"Bit-identical: {resumed.to_dict() == expected.to_dict()}")
@@ -0,0 +1,213 @@
+# counting.py
+
+import math
+from array import array
+
+from cards import Card, CARD_VIEWS
+
+# True counts are bucketed and looked up over this range; counts outside it are clamped
+TRUE_COUNT_RANGE = (-10, 10)
+
+
+class CountSystem:
+    """
+    A card-counting system: one weight per rank plus the initial running
+    count for a number of decks (non-zero for unbalanced systems like KO).
+
+    weights maps each rank in Card.RANKS to its tag. The per-rank and
+    per-card-code weight vectors are built once here so that updating a
+    RunningCount is a single lookup and add.
+    """
+
+    def __init__(self, name, weights, initial_count_per_deck=0, initial_count_offset=0):
+        self.name = name
+        self.weights = dict(weights)
+        self.initial_count_per_deck = initial_count_per_deck
+        self.initial_count_offset = initial_count_offset
+        self.rank_weights = tuple(self.weights[rank] for rank in Card.RANKS)
+        self.code_weights = tuple(self.weights[card.rank] for card in CARD_VIEWS)
+
+    @property
+    def balanced(self):
+        return sum(self.rank_weights) == 0
+
+    def initial_count(self, number_of_decks):
+        return self.initial_count_offset + self.initial_count_per_deck * number_of_decks
+
+    def __repr__(self):
+        return f"CountSystem({self.name!r})"
+
+
+def _tags(low, middle, high, **ranks):
+    # Expand a few rank groups into a full rank -> tag mapping
+    tags = {}
+    for ranks_in_group, tag in ((('2', '3', '4', '5', '6'), low), (('7', '8', '9'), middle),
+                                (('10', 'J', 'Q', 'K', 'A'), high)):
+        tags.update(dict.fromkeys(ranks_in_group, tag))
+    tags.update({rank.lstrip('_'): tag for rank, tag in ranks.items()})
+    return tags
+
+
+HI_LO = CountSystem('Hi-Lo', _tags(1, 0, -1))
+# KO starts at 4 - 4 * decks so that the key count lands near zero
+KO = CountSystem('KO', _tags(1, 0, -1, _7=1), initial_count_per_deck=-4, initial_count_offset=4)
+OMEGA_II = CountSystem('Omega II', _tags(1, 0, -2, _4=2, _5=2, _6=2, _7=1, _9=-1, A=0))
+ZEN = CountSystem('Zen', _tags(1, 0, -2, _4=2, _5=2, _6=2, _7=1, A=-1))
+
+COUNT_SYSTEMS = {system.name: system for system in (HI_LO, KO, OMEGA_II, ZEN)}
+
+
+class RunningCount:
+    """
+    The running count of one CountSystem over a shoe.
+
+    Created by running_count(); the shoe adds each dealt card's weight to
+    running and resets it when reshuffled.
+    """
+
+    def __init__(self, system, shoe):
+        self.system = system
+        self.shoe = shoe
+        self.number_of_decks = getattr(shoe, 'number_of_decks', 1)
+        self.by_rank = system.weights
+        self.by_code = system.code_weights
+        self.initial = system.initial_count(self.number_of_decks)
+        self.running = self.initial
+
+    def reset(self):
+        self.running = self.initial
+
+    def decks_remaining(self):
+        return self.shoe.cards_remaining() / 52
+
+    def true_count(self):
+        """
+        Returns the running count per deck remaining.
+        """
+        # Never divide by less than half a deck
+        return self.running / max(self.decks_remaining(), 0.5)
+
+
+def running_count(shoe, system):
+    """
+    Returns the shoe's RunningCount for system, attaching a new one the
+    first time. Attach counts before dealing; cards dealt earlier are not
+    counted until the next reshuffle.
+    """
+    count = shoe.counts.get(system.name)
+    if count is None:
+        count = shoe.counts[system.name] = RunningCount(system, shoe)
+    return count
+
+
+def true_count_bucket(true_count, low=TRUE_COUNT_RANGE[0], high=TRUE_COUNT_RANGE[1]):
+    """
+    Returns the bucket index (0 for low) of the floored true count, clamped to [low, high].
+    """
+    return min(max(math.floor(true_count), low), high) - low
+
+
+class BetSpread:
+    """
+    A count-driven bet policy for Game(bet_policy=...).
+
+    ramp maps a minimum (floored) true count to a bet in units, e.g.
+    {1: 2, 2: 4, 3: 8}; true counts below the lowest key bet min_units.
+    unit defaults to the table minimum and bets are clamped to the table
+    limits.
+    """
+
+    def __init__(self, system, ramp, unit=None, min_units=1):
+        self.system = system
+        self.unit = unit
+        low, high = TRUE_COUNT_RANGE
+        units = min_units
+        self.units = []
+        for true_count in range(low, high + 1):
+            units = ramp.get(true_count, units)
+            self.units.append(units)
+
+    def units_for(self, true_count):
+        return self.units[true_count_bucket(true_count)]
+
+    def __call__(self, game, player):
+        count = running_count(game.shoe, self.system)
+        minimum, maximum = game.table_limits
+        bet = self.units_for(count.true_count()) * (self.unit or minimum)
+        return min(max(bet, minimum), maximum)
+
+
+class TrueCountBuckets:
+    """
+    Per-true-count totals of round results, kept in preallocated arrays
+    indexed by true_count_bucket().
+
+    add() takes the net result in units of the round's initial bet, so
+    ev() is the player's edge at each true count whatever the bet spread.
+    """
+
+    def __init__(self, low=TRUE_COUNT_RANGE[0], high=TRUE_COUNT_RANGE[1]):
+        self.low = low
+        self.high = high
+        size = high - low + 1
+        self.rounds = array('d', bytes(8 * size))
+        self.net = array('d', bytes(8 * size))
+        self.net_squared = array('d', bytes(8 * size))
+
+    def add(self, true_count, net):
+        bucket = true_count_bucket(true_count, self.low, self.high)
+        self.rounds[bucket] += 1
+        self.net[bucket] += net
+        self.net_squared[bucket] += net * net
+
+    def merge(self, other):
+        """
+        Adds another TrueCountBuckets with the same range into this one and returns self.
+        """
+        if (other.low, other.high) != (self.low, self.high):
+            raise ValueError("Cannot merge true-count buckets with different ranges.")
+        for bucket in range(len(self.rounds)):
+            self.rounds[bucket] += other.rounds[bucket]
+            self.net[bucket] += other.net[bucket]
+            self.net_squared[bucket] += other.net_squared[bucket]
+        return self
+
+    def rows(self):
+        """
+        Yields (true_count, rounds, ev, stderr) for every bucket that has rounds.
+        """
+        for bucket, rounds in enumerate(self.rounds):
+            if not rounds:
+                continue
+            ev = self.net[bucket] / rounds
+            variance = max(self.net_squared[bucket] / rounds - ev * ev, 0.0)
+            yield self.low + bucket, int(rounds), ev, math.sqrt(variance / rounds)
+
+    def to_dict(self):
+        return {'low': self.low, 'high': self.high, 'rounds': list(self.rounds),
+                'net': list(self.net), 'net_squared': list(self.net_squared)}
+
+    @classmethod
+    def from_dict(cls, data):
+        buckets = cls(data['low'], data['high'])
+        buckets.rounds = array('d', data['rounds'])
+        buckets.net = array('d', data['net'])
+        buckets.net_squared = array('d', data['net_squared'])
+        return buckets
+
+
+# Test for counting systems
+if __name__ == "__main__":
+    from cards import Shoe, CompactShoe
+
+    for system in COUNT_SYSTEMS.values():
+        print(f"{system.name}: {system.rank_weights} balanced={system.balanced}")
+
+    for shoe_class in (Shoe, CompactShoe):
+        shoe = shoe_class(number_of_decks=6)
+        counts = [running_count(shoe, system) for system in COUNT_SYSTEMS.values()]
+        dealt = [shoe.deal_card() for _ in range(100)]
+        for count in counts:
+            expected = count.initial + sum(count.system.weights[card.rank] for card in dealt)
+            print(f"{shoe_class.__name__} {count.system.name}: running {count.running} (expected {expected}), "
+                  f"true count {count.true_count():.2f}")
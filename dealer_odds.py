@@ -0,0 +1,142 @@
+# dealer_odds.py
+
+from collections import namedtuple
+from functools import lru_cache
+
+from cards import Card, COMPOSITION_SIZE
+
+DealerProbabilities = namedtuple(
+    'DealerProbabilities',
+    ['total_17', 'total_18', 'total_19', 'total_20', 'total_21', 'blackjack', 'bust'])
+
+BLACKJACK = 5
+BUST = 6
+TEN = 9
+ACE = 0
+
+DEFAULT_CACHE_SIZE = 65536
+
+
+def full_composition(number_of_decks):
+    """
+    Returns the composition of a full shoe (see cards.COMPOSITION_INDEX).
+    """
+    return (4 * number_of_decks,) * TEN + (16 * number_of_decks,)
+
+
+def _up_card_index(up_card):
+    """
+    Accepts a Card or a card value (2-11, with 1 or 11 for an Ace) and
+    returns its composition index.
+    """
+    value = up_card.get_value() if isinstance(up_card, Card) else up_card
+    return ACE if value in (1, 11) else value - 1
+
+
+def _calculate(up, composition, hits_soft_17, peek):
+    counts = list(composition)
+    memo = {}
+
+    def play(hard, has_ace, cards):
+        soft = has_ace and hard <= 11
+        best = hard + 10 if soft else hard
+        if best > 21:
+            return BUST_ONLY
+        if best >= 17 and not (best == 17 and soft and hits_soft_17):
+            if best == 21 and cards == 2:
+                return BLACKJACK_ONLY
+            return STAND_ON[best]
+
+        key = tuple(counts)
+        cached = memo.get(key)
+        if cached is not None:
+            return cached
+
+        remaining = sum(counts)
+        excluded = None
+        if cards == 1 and peek:
+            # The dealer has already checked for blackjack, so the hole card
+            # cannot complete one.
+            if up == ACE:
+                excluded = TEN
+            elif up == TEN:
+                excluded = ACE
+            if excluded is not None:
+                remaining -= counts[excluded]
+
+        result = [0.0] * len(DealerProbabilities._fields)
+        for index in range(COMPOSITION_SIZE):
+            count = counts[index]
+            if not count or index == excluded:
+                continue
+            probability = count / remaining
+            counts[index] -= 1
+            outcome = play(hard + index + 1, has_ace or index == ACE, cards + 1)
+            counts[index] += 1
+            for slot in range(len(result)):
+                result[slot] += probability * outcome[slot]
+        result = tuple(result)
+        memo[key] = result
+        return result
+
+    return DealerProbabilities(*play(up + 1, up == ACE, 1))
+
+
+def _single(slot):
+    result = [0.0] * len(DealerProbabilities._fields)
+    result[slot] = 1.0
+    return tuple(result)
+
+
+STAND_ON = {total: _single(total - 17) for total in range(17, 22)}
+BLACKJACK_ONLY = _single(BLACKJACK)
+BUST_ONLY = _single(BUST)
+
+_cached_calculate = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_calculate)
+
+
+def dealer_probabilities(up_card, composition, rules, peek=True):
+    """
+    Returns the exact DealerProbabilities of the dealer finishing on 17-21,
+    blackjack or bust.
+
+    up_card is a Card or card value and composition is the remaining shoe
+    counted by value, not including the up card. With peek=True (as in Game)
+    the dealer has already checked for blackjack, so the result is
+    conditioned on the dealer not having one. Results are kept in a bounded
+    LRU cache keyed by up card, composition and the rules that affect the
+    dealer (dealer_hits_soft_17 and peek).
+    """
+    return _cached_calculate(_up_card_index(up_card), tuple(composition),
+                             rules.dealer_hits_soft_17, peek)
+
+
+def set_cache_size(maxsize):
+    """
+    Replaces the result cache with an empty one holding at most maxsize entries.
+    """
+    global _cached_calculate
+    _cached_calculate = lru_cache(maxsize=maxsize)(_calculate)
+
+
+def cache_info():
+    return _cached_calculate.cache_info()
+
+
+def cache_clear():
+    _cached_calculate.cache_clear()
+
+
+# Test for dealer probabilities
+if __name__ == "__main__":
+    from rules import Rules
+
+    rules = Rules()
+    composition = list(full_composition(rules.number_of_decks))
+    for value in range(2, 12):
+        index = _up_card_index(value)
+        composition[index] -= 1
+        probabilities = dealer_probabilities(value, composition, rules, peek=False)
+        composition[index] += 1
+        print(f"Up card {value:2}: " + ' '.join(f"{p:.4f}" for p in probabilities))
+    print(cache_info())
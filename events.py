@@ -0,0 +1,129 @@
+# events.py
+
+from collections import namedtuple
+
+Event = namedtuple('Event', ['round', 'kind', 'data'])
+
+# Outcome codes of a hand, shared by the recorders and the batch engine; 'none' marks an empty slot
+OUTCOMES = ('none', 'lose', 'push', 'win', 'blackjack', 'surrender')
+
+
+class EventSink:
+    """
+    Base class for receivers of game events.
+
+    Game only builds an event's payload when the sink is enabled, so a
+    disabled sink costs a single attribute check per event.
+    """
+
+    enabled = True
+
+    def emit(self, kind, **data):
+        raise NotImplementedError("EventSink must implement emit method.")
+
+
+class NullSink(EventSink):
+    """
+    Discards every event. Use for headless batch runs.
+    """
+
+    enabled = False
+
+    def emit(self, kind, **data):
+        pass
+
+
+class TeeSink(EventSink):
+    """
+    Forwards every event to several sinks, skipping the disabled ones.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = [sink for sink in sinks if sink.enabled]
+        self.enabled = bool(self.sinks)
+
+    def emit(self, kind, **data):
+        for sink in self.sinks:
+            sink.emit(kind, **data)
+
+
+def _card_list(hand):
+    return [str(card) for card in hand.cards]
+
+
+class BufferedSink(EventSink):
+    """
+    Collects events as structured Event tuples.
+
+    Hands and players are reduced to plain values (card strings and names)
+    when the event is recorded, so the buffer stays valid after the round.
+    """
+
+    def __init__(self, max_events=None):
+        self.events = []
+        self.max_events = max_events
+        self.round = 0
+
+    def emit(self, kind, **data):
+        if kind == 'round_start':
+            self.round = data['round']
+        if self.max_events is not None and len(self.events) >= self.max_events:
+            return
+        for key, value in data.items():
+            if key == 'player':
+                data[key] = value.name
+            elif key.endswith('hand'):
+                data[key] = _card_list(value)
+        self.events.append(Event(self.round, kind, data))
+
+    def clear(self):
+        self.events = []
+
+
+class ConsoleSink(EventSink):
+    """
+    Prints events as human-readable text. This is the default for Game.
+    """
+
+    REJECTIONS = {
+        'double': "Double down not allowed.",
+        'split': "Split not allowed.",
+        'surrender': "Surrender not allowed.",
+    }
+
+    MESSAGES = {
+        'round_start': lambda d: f"--- Starting Round {d['round']} ---",
+        'blackjack_push': lambda d: f"{d['player'].name} and dealer both have blackjack. It's a push.",
+        'player_blackjack': lambda d: f"{d['player'].name} has blackjack and wins!",
+        'dealer_blackjack': lambda d: "Dealer has blackjack.",
+        'dealer_blackjack_loss': lambda d: f"{d['player'].name} loses. Dealer has blackjack.",
+        'action_rejected': lambda d: ConsoleSink.REJECTIONS.get(d['action'], f"Unknown action '{d['action']}'."),
+        'dealer_initial': lambda d: f"\nDealer's initial hand: {_card_list(d['hand'])}",
+        'dealer_final': lambda d: f"Dealer's final hand: {_card_list(d['hand'])} with value {d['value']}",
+        'dealer_result': lambda d: f"\nDealer's hand {_card_list(d['hand'])} with value {d['value']}",
+        'hand_surrendered': lambda d: f"{d['player'].name} surrendered. Half of the bet is returned.",
+        'hand_result': lambda d: f"{d['player'].name}'s hand {_card_list(d['hand'])} with value {d['value']}: {d['result']}",
+        'reshuffle': lambda d: "Reshuffling the shoe.",
+    }
+
+    def emit(self, kind, **data):
+        message = self.MESSAGES.get(kind)
+        if message is not None:
+            print(message(data))
+
+
+# Test for event sinks
+if __name__ == "__main__":
+    from hand import Hand
+    from cards import Card
+
+    hand = Hand()
+    hand.add_card(Card('10', 'Hearts'))
+    hand.add_card(Card('7', 'Spades'))
+
+    ConsoleSink().emit('dealer_final', hand=hand, value=hand.get_best_value())  # Output: Dealer's final hand: ...
+
+    sink = BufferedSink()
+    sink.emit('round_start', round=1)
+    sink.emit('dealer_final', hand=hand, value=hand.get_best_value())
+    print(sink.events)  # Output: [Event(round=1, kind='round_start', ...), ...]
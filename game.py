@@ -1,42 +1,76 @@
 # game.py
 
-from cards import Shoe
-from hand import Hand
+from cards import Shoe, CompactShoe
+from hand import HandPool
 from players import Player, Dealer
 from rules import Rules
+from events import ConsoleSink
+from instrumentation import Instrumentation
+from strategy import HIT_FLAG, STAND_FLAG, DOUBLE_FLAG, SPLIT_FLAG, SURRENDER_FLAG
 
 class Game:
     """
     Manages the flow of the game.
     """
 
-    def __init__(self, players, dealer, rules, table_limits=(10, 1000)):
+    def __init__(self, players, dealer, rules, table_limits=(10, 1000), compact_shoe=False,
+                 event_sink=None, rng=None, bet_policy=None, pool_hands=False, shoe=None):
         self.players = players
         self.dealer = dealer
         self.rules = rules
         self.table_limits = table_limits
-        self.shoe = Shoe(number_of_decks=rules.number_of_decks)
-        self.shoe.shuffle()
+        # shoe is a shoe, or a class or factory called as shoe(number_of_decks=..., rng=...),
+        # e.g. ContinuousShuffler or functools.partial(Shoe, penetration=0.6).
+        # A ready-made shoe is used as it is, so a prepared or restored order is kept.
+        if shoe is None:
+            shoe = CompactShoe if compact_shoe else Shoe
+        if hasattr(shoe, 'deal_card') and not isinstance(shoe, type):
+            self.shoe = shoe
+        else:
+            # rng (a random.Random) makes the shoe order reproducible
+            self.shoe = shoe(number_of_decks=rules.number_of_decks, rng=rng)
+            self.shoe.shuffle()
         self.current_round = 0
         self.round_over = False
+        # Receives round events; see events.py. Pass NullSink() for silent runs.
+        self.events = event_sink if event_sink is not None else ConsoleSink()
+        # Called as bet_policy(game, player) for each bet, e.g. counting.BetSpread
+        self.bet_policy = bet_policy
+        # Called as settle_hook(player, hand, result, net) for every settled hand,
+        # e.g. by results_store.ResultsRecorder; unlike events it costs nothing per action
+        self.settle_hook = None
+        # Low-allocation mode: every seat and the dealer reuse hands from one pool
+        self.hand_pool = HandPool() if pool_hands else None
+        for seat in [*players, dealer]:
+            seat.hand_pool = self.hand_pool
 
     def start_round(self):
-            self.current_round += 1
-            print(f"--- Starting Round {self.current_round} ---")
-            self.dealer.clear_hands()
-            for player in self.players:
-                player.clear_hands()
-                bet = self.get_player_bet(player)
-                player.place_bet(bet)
-            self.deal_initial_cards()
-            self.check_for_blackjacks()
+            self.begin_round()
             if not self.round_over:
                 self.player_actions()
                 self.dealer_actions()
-            self.settle_bets()
-            self.check_shoe()
+            self.finish_round()
+
+    def begin_round(self):
+        # Take bets, deal and check for blackjacks; round_over is set if no one has to act
+        self.current_round += 1
+        if self.events.enabled:
+            self.events.emit('round_start', round=self.current_round)
+        self.dealer.clear_hands()
+        for player in self.players:
+            player.clear_hands()
+            bet = self.get_player_bet(player)
+            player.place_bet(bet)
+        self.deal_initial_cards()
+        self.check_for_blackjacks()
+
+    def finish_round(self):
+        self.settle_bets()
+        self.check_shoe()
 
     def get_player_bet(self, player):
+        if self.bet_policy is not None:
+            return self.bet_policy(self, player)
         # For testing, we can use a fixed bet
         return self.table_limits[0]
 
@@ -48,7 +82,7 @@ class Game:
                 card2 = self.shoe.deal_card()
                 player.receive_card(hand, card1)
                 player.receive_card(hand, card2)
-        dealer_hand = Hand()
+        dealer_hand = self.dealer.new_hand()
         dealer_hand.add_card(self.shoe.deal_card())
         dealer_hand.add_card(self.shoe.deal_card())
         self.dealer.hands.append(dealer_hand)
@@ -62,77 +96,122 @@ class Game:
 
 
     def play_hand(self, player, hand):
+        # Split hands are appended to player.hands while player_actions is
+        # iterating it; marking them complete keeps them from being replayed
+        hand.is_complete = True
         while True:
             action = player.decide_action(hand, self.dealer_up_card(), self.rules)
-            if action == 'hit':
+            outcome = self.apply_action(player, hand, action)
+            if outcome is None:
+                # Asking again could repeat the refused action forever
+                outcome = self.apply_action(player, hand, self.fallback_action(action))
+            if outcome is False:
+                continue
+            if outcome is not True:
+                # Split: play out both hands
+                self.play_hand(player, hand)
+                self.play_hand(player, outcome)
+            return
+
+    def apply_action(self, player, hand, action):
+        """
+        Carries out one decision for a hand. Returns False if the player
+        should be asked again, True once the hand is finished, the new hand
+        after a split, or None if the action was refused (see
+        fallback_action). Doubles and splits the seat cannot cover are
+        refused rather than raised.
+        """
+        if action == 'hit':
+            card = self.shoe.deal_card()
+            player.receive_card(hand, card)
+            hand.action_flags |= HIT_FLAG
+            if self.events.enabled:
+                self.events.emit('action', player=player, hand=hand, action=action)
+            return hand.is_bust()
+        elif action == 'stand':
+            hand.action_flags |= STAND_FLAG
+            if self.events.enabled:
+                self.events.emit('action', player=player, hand=hand, action=action)
+            return True
+        elif action == 'double':
+            if (self.rules.double_down_allowed_on and hand.can_double_down(self.rules)
+                    and player.bankroll >= hand.bet):
+                player.double_down(hand)
                 card = self.shoe.deal_card()
                 player.receive_card(hand, card)
-                if hand.is_bust():
-                    break
-            elif action == 'stand':
-                break
-            elif action == 'double':
-                if self.rules.double_down_allowed_on and hand.can_double_down(self.rules):
-                    player.double_down(hand)
-                    card = self.shoe.deal_card()
-                    player.receive_card(hand, card)
-                    break
-                else:
-                    print("Double down not allowed.")
-                    continue
-            elif action == 'split':
-                if hand.can_split(self.rules):
-                    new_hand = player.split_hand(hand)
-                    player.receive_card(hand, self.shoe.deal_card())
-                    player.receive_card(new_hand, self.shoe.deal_card())
-                    self.play_hand(player, hand)
-                    self.play_hand(player, new_hand)
-                    return
-                else:
-                    print("Split not allowed.")
-                    continue
-            elif action == 'surrender':
-                if self.rules.surrender_allowed != 'none':
-                    player.surrender(hand)
-                    break
-                else:
-                    print("Surrender not allowed.")
-                    continue
-            else:
-                print(f"Unknown action '{action}'.")
-                break
+                hand.action_flags |= DOUBLE_FLAG
+                if self.events.enabled:
+                    self.events.emit('action', player=player, hand=hand, action=action)
+                return True
+        elif action == 'split':
+            if hand.can_split(self.rules) and player.bankroll >= hand.bet:
+                new_hand = player.split_hand(hand)
+                # The new hand shares the actions taken before the split
+                hand.action_flags |= SPLIT_FLAG
+                new_hand.action_flags = hand.action_flags
+                if self.events.enabled:
+                    self.events.emit('action', player=player, hand=hand, action=action)
+                    self.events.emit('hand_split', player=player, hand=hand, new_hand=new_hand)
+                player.receive_card(hand, self.shoe.deal_card())
+                player.receive_card(new_hand, self.shoe.deal_card())
+                return new_hand
+        elif action == 'surrender':
+            if self.rules.surrender_allowed != 'none' and len(hand.cards) == 2 and not hand.is_split:
+                player.surrender(hand)
+                hand.action_flags |= SURRENDER_FLAG
+                if self.events.enabled:
+                    self.events.emit('action', player=player, hand=hand, action=action)
+                return True
+        else:
+            # Unknown actions end the hand
+            if self.events.enabled:
+                self.events.emit('action_rejected', player=player, hand=hand, action=action)
+            return True
+        if self.events.enabled:
+            self.events.emit('action_rejected', player=player, hand=hand, action=action)
+        return None
+
+    def fallback_action(self, action):
+        # Played instead of a refused action: a refused double hits, anything else stands
+        return 'hit' if action == 'double' else 'stand'
 
     def dealer_up_card(self):
         return self.dealer.hands[0].cards[0]
 
     def dealer_actions(self):
         hand = self.dealer.hands[0]
-        print(f"\nDealer's initial hand: {[str(card) for card in hand.cards]}")
+        if self.events.enabled:
+            self.events.emit('dealer_initial', hand=hand)
         self.dealer.play_hand(hand, self.rules, self.shoe)
-        print(f"Dealer's final hand: {[str(card) for card in hand.cards]} with value {hand.get_best_value()}")
+        if self.events.enabled:
+            self.events.emit('dealer_final', hand=hand, value=hand.get_best_value())
 
     def settle_bets(self):
         dealer_hand = self.dealer.hands[0]
         dealer_value = dealer_hand.get_best_value()
         dealer_blackjack = dealer_hand.is_blackjack()
         dealer_bust = dealer_hand.is_bust()
-        print(f"\nDealer's hand {[str(card) for card in dealer_hand.cards]} with value {dealer_value}")
+        if self.events.enabled:
+            self.events.emit('dealer_result', hand=dealer_hand, value=dealer_value)
         for player in self.players:
             for hand in player.hands:
                 if hand.is_surrendered:
-                    print(f"{player.name} surrendered. Half of the bet is returned.")
+                    if self.events.enabled:
+                        self.events.emit('hand_surrendered', player=player, hand=hand, net=-hand.bet / 2)
+                    if self.settle_hook is not None:
+                        self.settle_hook(player, hand, 'surrender', -hand.bet / 2)
                     continue
                 player_value = hand.get_best_value()
                 player_blackjack = hand.is_blackjack()
+                payout = 0
                 if player_blackjack:
                     if dealer_blackjack:
                         # Both player and dealer have blackjack: push
-                        player.bankroll += hand.bet
+                        payout = hand.bet
                         result = 'push'
                     else:
                         # Player has blackjack, dealer does not
                         payout = hand.bet + hand.bet * self.rules.blackjack_payout
-                        player.bankroll += payout
                         result = 'blackjack'
                 elif dealer_blackjack:
                     # Dealer has blackjack, player does not
@@ -141,28 +220,40 @@ class Game:
                     result = 'lose'
                 elif dealer_bust or player_value > dealer_value:
                     payout = hand.bet * 2
-                    player.bankroll += payout
                     result = 'win'
                 elif player_value == dealer_value:
-                    player.bankroll += hand.bet
+                    payout = hand.bet
                     result = 'push'
                 else:
                     result = 'lose'
-                print(f"{player.name}'s hand {[str(card) for card in hand.cards]} with value {player_value}: {result}")
+                player.bankroll += payout
+                if self.settle_hook is not None:
+                    self.settle_hook(player, hand, result, payout - hand.bet)
+                if self.events.enabled:
+                    self.events.emit('hand_result', player=player, hand=hand, value=player_value, result=result,
+                                     net=payout - hand.bet)
 
 
 
     def check_shoe(self):
-        # Reshuffle the shoe if necessary
-        if len(self.shoe.cards) < (self.rules.number_of_decks * 52) * 0.25:
-            print("Reshuffling the shoe.")
-            self.shoe = Shoe(number_of_decks=self.rules.number_of_decks)
-            self.shoe.shuffle()
+        # Reshuffle once the cut card is out; continuous shufflers take the discards back instead
+        if self.shoe.needs_shuffle():
+            if self.events.enabled:
+                self.events.emit('reshuffle')
+            self.shoe.reshuffle()
+        self.shoe.end_round()
 
     def reset_for_next_round(self):
         # This method can be used if additional cleanup is needed
         pass
 
+    def instrument(self):
+        """
+        Starts recording per-phase timings and returns the Instrumentation;
+        call its detach() to stop. See instrumentation.py.
+        """
+        return Instrumentation().attach(self)
+
     def check_for_blackjacks(self):
         self.round_over = False
         dealer_hand = self.dealer.hands[0]
@@ -172,26 +263,26 @@ class Game:
             for hand in player.hands:
                 player_blackjack = hand.is_blackjack()
                 if player_blackjack:
+                    # Naturals are paid in settle_bets
                     if dealer_blackjack:
-                        # Both have blackjack: push
-                        player.bankroll += hand.bet
-                        print(f"{player.name} and dealer both have blackjack. It's a push.")
+                        if self.events.enabled:
+                            self.events.emit('blackjack_push', player=player)
                     else:
-                        # Player has blackjack, dealer does not
-                        payout = hand.bet + (hand.bet * self.rules.blackjack_payout)
-                        player.bankroll += payout
-                        print(f"{player.name} has blackjack and wins!")
+                        if self.events.enabled:
+                            self.events.emit('player_blackjack', player=player)
                     # Mark hand as completed
                     hand.is_complete = True
 
         # If dealer has blackjack and players do not
         if dealer_blackjack:
-            print("Dealer has blackjack.")
+            if self.events.enabled:
+                self.events.emit('dealer_blackjack')
             for player in self.players:
                 for hand in player.hands:
                     if not hand.is_blackjack():
                         # Player loses bet
-                        print(f"{player.name} loses. Dealer has blackjack.")
+                        if self.events.enabled:
+                            self.events.emit('dealer_blackjack_loss', player=player)
                     # Mark hand as completed
                     hand.is_complete = True
 
@@ -5,53 +5,106 @@ class Hand:
     Represents a hand of cards for a player or dealer.
     """
 
+    __slots__ = ('cards', 'bet', 'is_split', 'is_double_down', 'is_surrendered', 'is_complete',
+                 'split_count', 'hard_total', 'ace_count', 'best_value', 'tags', 'tag_count',
+                 'action_flags')
+
     def __init__(self, bet=0):
         self.cards = []
+        # Decision cells this hand passed through, filled in by attribution.EVAttribution;
+        # the array is allocated on first use and kept when the hand is reused
+        self.tags = None
+        self.reset(bet)
+
+    def reset(self, bet=0):
+        """
+        Empties the hand and clears its state so it can be reused.
+        """
+        self.cards.clear()
         self.bet = bet
         self.is_split = False
         self.is_double_down = False
         self.is_surrendered = False
         self.is_complete = False
+        # Number of splits already made by the seat this hand belongs to
+        self.split_count = 0
+        # Running totals kept up to date by add_card and pop_card.
+        # hard_total counts every Ace as 1; best_value counts one Ace as 11
+        # whenever that does not bust the hand.
+        self.hard_total = 0
+        self.ace_count = 0
+        self.best_value = 0
+        self.tag_count = 0
+        # One bit per action taken (strategy.ACTION_FLAGS), set by Game
+        self.action_flags = 0
 
     def add_card(self, card):
         self.cards.append(card)
+        if card.rank == 'A':
+            self.ace_count += 1
+            self.hard_total += 1
+        else:
+            self.hard_total += card.get_value()
+        self._update_best_value()
+
+    def pop_card(self):
+        """
+        Removes and returns the last card, e.g. when splitting a pair.
+        """
+        card = self.cards.pop()
+        if card.rank == 'A':
+            self.ace_count -= 1
+            self.hard_total -= 1
+        else:
+            self.hard_total -= card.get_value()
+        self._update_best_value()
+        return card
+
+    def _update_best_value(self):
+        if self.ace_count and self.hard_total <= 11:
+            self.best_value = self.hard_total + 10
+        else:
+            self.best_value = self.hard_total
 
     def get_values(self):
         """
         Returns all possible hand values considering Aces as 1 or 11.
         """
-        values = [0]
-        for card in self.cards:
-            if card.rank == 'A':
-                temp_values = []
-                for val in values:
-                    temp_values.extend([val + 1, val + 11])
-                values = temp_values
-            else:
-                for i in range(len(values)):
-                    values[i] += card.get_value()
-        return set(values)
+        return {self.hard_total + 10 * aces_high for aces_high in range(self.ace_count + 1)}
 
     def get_best_value(self):
         """
         Returns the highest hand value less than or equal to 21.
         If all values are over 21, returns the minimum value.
         """
-        values = self.get_values()
-        valid_values = [v for v in values if v <= 21]
-        return max(valid_values) if valid_values else min(values)
+        return self.best_value
+
+    def is_soft(self):
+        """
+        Returns True if the best value counts an Ace as 11.
+        """
+        return self.best_value != self.hard_total
 
     def is_blackjack(self):
-        return len(self.cards) == 2 and self.get_best_value() == 21
+        # Two-card 21 on a split hand is not a natural
+        return len(self.cards) == 2 and self.best_value == 21 and not self.is_split
 
     def is_bust(self):
-        return self.get_best_value() > 21
+        return self.best_value > 21
 
     def can_split(self, rules):
         if len(self.cards) != 2:
             return False
+        splitting_rules = rules.splitting_rules
+        if self.split_count >= splitting_rules.get('max_splits', 3):
+            return False
+        if self.cards[0].rank == 'A':
+            if not splitting_rules.get('can_split_aces', True):
+                return False
+            if self.is_split and not splitting_rules.get('resplit_aces_allowed', False):
+                return False
         if self.cards[0].rank != self.cards[1].rank:
-            if rules.splitting_rules.get('can_split_unlike_tens', False):
+            if splitting_rules.get('can_split_unlike_tens', False):
                 # Check if both cards are 10-value cards
                 return (self.cards[0].get_value() == 10 and self.cards[1].get_value() == 10)
             else:
@@ -59,8 +112,34 @@ class Hand:
         return True
 
     def can_double_down(self, rules):
-        total = self.get_best_value()
-        return total in rules.double_down_allowed_on
+        if len(self.cards) != 2:
+            return False
+        if self.is_split and not rules.double_after_split_allowed:
+            return False
+        return self.best_value in rules.double_down_allowed_on
+
+
+class HandPool:
+    """
+    Free list of Hand objects that are reset and reused instead of
+    allocated every round. Released hands must no longer be referenced.
+    """
+
+    __slots__ = ('free',)
+
+    def __init__(self):
+        self.free = []
+
+    def acquire(self, bet=0):
+        if self.free:
+            hand = self.free.pop()
+            hand.reset(bet)
+            return hand
+        return Hand(bet=bet)
+
+    def release(self, hands):
+        self.free.extend(hands)
+
 
 # Test for Hand class
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+# history.py
+
+import os
+import struct
+
+import numpy as np
+
+from cards import Card
+from events import EventSink, OUTCOMES
+from strategy import ACTIONS
+
+# File header: magic, format version, record size in bytes
+HISTORY_MAGIC = b'BJHH'
+HISTORY_VERSION = 1
+_HEADER = struct.Struct('<4sBH')
+
+MAX_CARDS = 12
+MAX_ACTIONS = 12
+
+# Cards are stored as rank codes: 0 for an empty slot, then 1-13 in Card.RANKS order
+RANK_CODES = {rank: index + 1 for index, rank in enumerate(Card.RANKS)}
+# Actions are stored as 0 for an empty slot, then 1 + the strategy action code
+ACTION_NAMES = ('',) + ACTIONS
+ACTION_CODES = {name: code for code, name in enumerate(ACTION_NAMES) if name}
+OUTCOME_CODES = {name: code for code, name in enumerate(OUTCOMES)}
+
+# One record per settled hand
+RECORD_DTYPE = np.dtype([
+    ('round', '<u4'),
+    ('seat', 'u1'),
+    ('hand', 'u1'),
+    ('num_cards', 'u1'),
+    ('num_dealer_cards', 'u1'),
+    ('num_actions', 'u1'),
+    ('outcome', 'u1'),
+    ('cards', 'u1', (MAX_CARDS,)),
+    ('dealer_cards', 'u1', (MAX_CARDS,)),
+    ('actions', 'u1', (MAX_ACTIONS,)),
+    ('bet', '<f4'),
+    ('net', '<f4'),
+])
+_RECORD = struct.Struct(f'<IBBBBBB{MAX_CARDS}s{MAX_CARDS}s{MAX_ACTIONS}sff')
+assert _RECORD.size == RECORD_DTYPE.itemsize
+
+
+def _rank_codes(hand):
+    return bytes(RANK_CODES[card.rank] for card in hand.cards[:MAX_CARDS])
+
+
+class HandHistoryRecorder(EventSink):
+    """
+    Event sink that writes one fixed-width record per settled hand.
+
+    A record holds the round, seat and hand number, the player's and the
+    dealer's cards as rank codes, the actions taken, the final bet and the
+    net result. Records are packed into a buffer of chunk_records and
+    written a chunk at a time; call close() (or use the recorder as a
+    context manager) to write the last partial chunk. Sequences longer than
+    MAX_CARDS or MAX_ACTIONS are truncated, with the full length kept in
+    the count fields (saturating at 255).
+
+    Seats are numbered in the order players first settle a hand. Combine
+    with other sinks through events.TeeSink.
+    """
+
+    def __init__(self, path, chunk_records=65536):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.buffer = bytearray(chunk_records * _RECORD.size)
+        self.pending = 0
+        self.records = 0
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, _RECORD.size))
+        self.round = 0
+        self.seats = {}
+        self.hand_numbers = {}
+        self.actions = {}
+        self.dealer_cards = b''
+
+    def emit(self, kind, **data):
+        if kind == 'action':
+            self.actions.setdefault(data['hand'], bytearray()).append(ACTION_CODES[data['action']])
+        elif kind == 'hand_result':
+            self._record(data['player'], data['hand'], data['result'], data['net'])
+        elif kind == 'hand_surrendered':
+            self._record(data['player'], data['hand'], 'surrender', data['net'])
+        elif kind == 'hand_split':
+            # The new hand shares the actions taken before the split
+            self.actions[data['new_hand']] = bytearray(self.actions.get(data['hand'], b''))
+        elif kind == 'dealer_result':
+            self.dealer_cards = data['hand'].cards
+        elif kind == 'round_start':
+            self.round = data['round']
+            self.hand_numbers.clear()
+            self.actions.clear()
+
+    def _record(self, player, hand, result, net):
+        seat = self.seats.get(player)
+        if seat is None:
+            seat = self.seats[player] = len(self.seats)
+        number = self.hand_numbers.get(seat, 0)
+        self.hand_numbers[seat] = number + 1
+        actions = self.actions.get(hand, b'')
+        dealer_cards = self.dealer_cards
+        _RECORD.pack_into(
+            self.buffer, self.pending * _RECORD.size,
+            self.round, seat, number,
+            min(len(hand.cards), 255), min(len(dealer_cards), 255), min(len(actions), 255),
+            OUTCOME_CODES[result],
+            _rank_codes(hand),
+            bytes(RANK_CODES[card.rank] for card in dealer_cards[:MAX_CARDS]),
+            bytes(actions[:MAX_ACTIONS]),
+            hand.bet, net)
+        self.pending += 1
+        self.records += 1
+        if self.pending == self.chunk_records:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(memoryview(self.buffer)[:self.pending * _RECORD.size])
+            self.pending = 0
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HandHistory:
+    """
+    Read-only view of a file written by HandHistoryRecorder.
+
+    The file is memory-mapped, so records is a zero-copy NumPy structured
+    array (RECORD_DTYPE) and only the pages that are touched are read.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} is not a hand history file.")
+        magic, version, record_size = _HEADER.unpack(header)
+        if magic != HISTORY_MAGIC:
+            raise ValueError(f"{path} is not a hand history file.")
+        if version != HISTORY_VERSION or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} was written by an unsupported format version ({version}).")
+        count = (os.path.getsize(path) - _HEADER.size) // record_size
+        self.path = path
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=_HEADER.size, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def scan(self, predicate=None, chunk_records=1 << 20):
+        """
+        Yields the records matching predicate, one chunk at a time.
+
+        predicate takes a structured array chunk and returns a boolean mask,
+        e.g. lambda r: r['outcome'] == OUTCOME_CODES['blackjack']. Only the
+        matching records of each chunk are copied out of the map.
+        """
+        for start in range(0, len(self.records), chunk_records):
+            chunk = self.records[start:start + chunk_records]
+            if predicate is None:
+                yield chunk
+            else:
+                mask = predicate(chunk)
+                if mask.any():
+                    yield chunk[mask]
+
+    def select(self, predicate, chunk_records=1 << 20):
+        """
+        Returns every matching record as one in-memory array.
+        """
+        chunks = list(self.scan(predicate, chunk_records))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD_DTYPE)
+
+    def count(self, predicate, chunk_records=1 << 20):
+        return sum(int(predicate(chunk).sum()) for chunk in self.scan(None, chunk_records))
+
+    def total_net(self, predicate=None, chunk_records=1 << 20):
+        return sum(float(chunk['net'].sum(dtype=np.float64)) for chunk in self.scan(predicate, chunk_records))
+
+    @staticmethod
+    def decode(record):
+        """
+        Returns one record as a dict of plain values, with ranks and action names.
+        """
+        return {
+            'round': int(record['round']),
+            'seat': int(record['seat']),
+            'hand': int(record['hand']),
+            'cards': [Card.RANKS[code - 1] for code in record['cards'][:record['num_cards']]],
+            'dealer_cards': [Card.RANKS[code - 1]
+                             for code in record['dealer_cards'][:record['num_dealer_cards']]],
+            'actions': [ACTION_NAMES[code] for code in record['actions'][:record['num_actions']]],
+            'outcome': OUTCOMES[record['outcome']],
+            'bet': float(record['bet']),
+            'net': float(record['net']),
+        }
+
+
+# Test for the hand-history recorder and reader
+if __name__ == "__main__":
+    import random
+    import tempfile
+    from game import Game
+    from players import Player, Dealer
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    players = [Player(bankroll=10 ** 7, strategy=BasicStrategy(rules), name=f"Seat_{seat}") for seat in range(3)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.bjh')
+        with HandHistoryRecorder(path) as recorder:
+            game = Game(players=players, dealer=Dealer(), rules=rules, compact_shoe=True,
+                        event_sink=recorder, rng=random.Random(7))
+            for _ in range(20000):
+                game.start_round()
+        history = HandHistory(path)
+        print(f"{len(history)} hands, {os.path.getsize(path)} bytes")
+        print(HandHistory.decode(history[0]))
+        doubles = history.count(lambda r: (r['actions'] == ACTION_CODES['double']).any(axis=1))
+        print(f"Doubled hands: {doubles}")
+        net = history.total_net()
+        print(f"Net from history: {net}, from bankrolls: {sum(p.bankroll for p in players) - 3 * 10 ** 7}")
+        del history
@@ -0,0 +1,295 @@
+# house_edge.py
+
+from cards import Card, COMPOSITION_SIZE
+from dealer_odds import dealer_probabilities, full_composition, ACE, TEN
+from hand import Hand
+from strategy import FIRST_TWO, SPLIT_TWO, LATER
+
+# One representative card per composition index, for asking strategies
+_CARDS = tuple(Card(rank, 'Spades') for rank in ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10'))
+_OTHER_TEN = Card('J', 'Spades')
+
+
+def _remove(composition, index):
+    counts = list(composition)
+    counts[index] -= 1
+    return tuple(counts)
+
+
+def _add(hand, index):
+    counts = list(hand)
+    counts[index] += 1
+    return tuple(counts)
+
+
+def _totals(hand):
+    hard = sum((index + 1) * count for index, count in enumerate(hand))
+    soft = hand[ACE] > 0 and hard <= 11
+    return hard, (hard + 10 if soft else hard)
+
+
+class HouseEdgeCalculator:
+    """
+    Computes the expected value of a Rules configuration combinatorially.
+
+    Every initial player hand and dealer up card is enumerated over the
+    shoe composition for number_of_decks. Player draw trees use exact card
+    removal; dealer outcomes come from dealer_odds with the up card and the
+    player's first two cards removed, which keeps the number of distinct
+    dealer calculations small at a cost of a few thousandths of a percent.
+    Play follows Game: the dealer peeks for blackjack, doubles and late
+    surrender are only offered on the first two cards, double after split
+    and the splitting_rules limits apply, and split hands can be played out
+    like any other hand.
+
+    With strategy=None every decision takes the highest-EV action; otherwise
+    the strategy's decide_action is asked, exactly as Game would ask it.
+    Resplits use the standard approximation that every split hand draws
+    from the same composition.
+    """
+
+    def __init__(self, rules, strategy=None):
+        self.rules = rules
+        self.strategy = strategy
+        self.shoe = full_composition(rules.number_of_decks)
+        self.doubles = set(rules.double_down_allowed_on)
+        self.surrender = rules.surrender_allowed != 'none'
+        splitting_rules = rules.splitting_rules
+        self.max_splits = splitting_rules.get('max_splits', 3)
+        self.can_split_aces = splitting_rules.get('can_split_aces', True)
+        self.resplit_aces = splitting_rules.get('resplit_aces_allowed', False)
+        self.split_unlike_tens = splitting_rules.get('can_split_unlike_tens', False)
+        self._values = {}
+        self._stand_tables = {}
+        self.up_card_evs = None
+
+    def expected_value(self):
+        """
+        Returns the player's expected net result per initial bet.
+        """
+        total_cards = sum(self.shoe)
+        ev = 0.0
+        self.up_card_evs = {}
+        for up in range(COMPOSITION_SIZE):
+            up_ev = 0.0
+            after_up = _remove(self.shoe, up)
+            for first in range(COMPOSITION_SIZE):
+                first_probability = after_up[first] / (total_cards - 1)
+                if not first_probability:
+                    continue
+                after_first = _remove(after_up, first)
+                for second in range(first, COMPOSITION_SIZE):
+                    probability = first_probability * after_first[second] / (total_cards - 2)
+                    if not probability:
+                        continue
+                    if second != first:
+                        # (first, second) and (second, first) are the same hand
+                        probability *= 2
+                    up_ev += probability * self.initial_hand_ev(first, second, up)
+            self.up_card_evs[up] = up_ev
+            ev += self.shoe[up] / total_cards * up_ev
+        return ev
+
+    def house_edge(self):
+        return -self.expected_value()
+
+    def initial_hand_ev(self, first, second, up):
+        """
+        Returns the EV of a two-card starting hand against an up card,
+        including the dealer's blackjack check. Cards are composition indexes.
+        """
+        composition = _remove(_remove(_remove(self.shoe, up), first), second)
+        remaining = sum(composition)
+        if up == ACE:
+            dealer_blackjack = composition[TEN] / remaining
+        elif up == TEN:
+            dealer_blackjack = composition[ACE] / remaining
+        else:
+            dealer_blackjack = 0.0
+        player_blackjack = {first, second} == {ACE, TEN}
+        if player_blackjack:
+            return (1 - dealer_blackjack) * self.rules.blackjack_payout
+        return -dealer_blackjack + (1 - dealer_blackjack) * self.play_ev(first, second, up)
+
+    def play_ev(self, first, second, up):
+        """
+        Returns the EV of playing a two-card hand once the dealer is known
+        not to have blackjack.
+        """
+        composition = _remove(_remove(_remove(self.shoe, up), first), second)
+        hand = _add(_add((0,) * COMPOSITION_SIZE, first), second)
+        evs = self.action_evs(up, composition, composition, hand, FIRST_TWO)
+        if first != second or not self.may_split(first, resplit=False):
+            return self._choose(evs, hand, up, FIRST_TWO)
+        split = dict(evs, split=self.split_ev(first, up))
+        with_split = self._choose(split, hand, up, FIRST_TWO, can_split=True)
+        if first == TEN and not self.split_unlike_tens:
+            # Only a pair of same-rank tens may be split
+            same_rank = self.shoe[TEN] // 4
+            chance = (same_rank - 1) / (self.shoe[TEN] - 1)
+            no_split = self._choose(evs, hand, up, FIRST_TWO, unlike_tens=True)
+            return chance * with_split + (1 - chance) * no_split
+        return with_split
+
+    def action_evs(self, up, context, composition, hand, phase):
+        """
+        Returns a dict of EVs for stand, hit, and where allowed double and
+        surrender. context is the composition the dealer draws from and
+        composition the one the player draws from.
+        """
+        hard, best = _totals(hand)
+        stand_table = self._stand_table(up, context)
+        remaining = sum(composition)
+        evs = {'stand': stand_table[best]}
+        hit = 0.0
+        double = 0.0
+        for index in range(COMPOSITION_SIZE):
+            count = composition[index]
+            if not count:
+                continue
+            probability = count / remaining
+            next_hand = _add(hand, index)
+            next_hard, next_best = _totals(next_hand)
+            if next_hard > 21:
+                hit -= probability
+                double -= probability
+                continue
+            hit += probability * self.hand_ev(up, context, _remove(composition, index), next_hand, LATER)
+            double += probability * stand_table[next_best]
+        evs['hit'] = hit
+        can_double = phase == FIRST_TWO or (phase == SPLIT_TWO and self.rules.double_after_split_allowed)
+        if can_double and best in self.doubles:
+            evs['double'] = 2 * double
+        if phase == FIRST_TWO and self.surrender:
+            evs['surrender'] = -0.5
+        return evs
+
+    def hand_ev(self, up, context, composition, hand, phase):
+        """
+        Returns the EV of a hand that will not be split, memoized by hand and context.
+        """
+        key = (up, context, hand, phase)
+        value = self._values.get(key)
+        if value is None:
+            evs = self.action_evs(up, context, composition, hand, phase)
+            value = self._values[key] = self._choose(evs, hand, up, phase)
+        return value
+
+    def split_ev(self, pair, up):
+        """
+        Returns the combined EV of splitting a pair, including resplits up to max_splits.
+        """
+        no_resplit, resplit = self.split_evs(pair, up)
+        if resplit is None:
+            return no_resplit
+        if self.strategy is None:
+            return max(resplit, no_resplit)
+        hand = self._hand(_add(_add((0,) * COMPOSITION_SIZE, pair), pair), split=True)
+        hand.split_count = 1
+        wants_resplit = self.strategy.decide_action(hand, _CARDS[up], self.rules) == 'split'
+        return resplit if wants_resplit else no_resplit
+
+    def split_evs(self, pair, up):
+        """
+        Returns the EVs of splitting a pair without and with resplitting.
+        The second is None when the rules do not allow a resplit.
+        """
+        context = _remove(_remove(_remove(self.shoe, up), pair), pair)
+        remaining = sum(context)
+        single = _add((0,) * COMPOSITION_SIZE, pair)
+        average = 0.0
+        for index in range(COMPOSITION_SIZE):
+            if context[index]:
+                hand = _add(single, index)
+                average += context[index] / remaining * self.hand_ev(
+                    up, context, _remove(context, index), hand, SPLIT_TWO)
+        if not context[pair]:
+            return 2 * average, None
+        pair_hand = _add(single, pair)
+        paired = self.hand_ev(up, context, _remove(context, pair), pair_hand, SPLIT_TWO)
+        if pair == TEN and not self.split_unlike_tens:
+            pairing = max(self.shoe[TEN] // 4 - 2, 0) / remaining
+        else:
+            pairing = context[pair] / remaining
+        # EV of a split hand whose second card does not pair it again
+        unpaired = (average - pairing * paired) / (1 - pairing)
+
+        def pending_ev(pending, splits_left, resplit, memo):
+            # Expected EV of the hands still waiting for their second card
+            if not pending:
+                return 0.0
+            key = (pending, splits_left)
+            if key not in memo:
+                if resplit and splits_left:
+                    on_pair = pending_ev(pending + 1, splits_left - 1, resplit, memo)
+                else:
+                    on_pair = paired + pending_ev(pending - 1, splits_left, resplit, memo)
+                memo[key] = (pairing * on_pair
+                             + (1 - pairing) * (unpaired + pending_ev(pending - 1, splits_left, resplit, memo)))
+            return memo[key]
+
+        no_resplit = pending_ev(2, self.max_splits - 1, False, {})
+        if not self.may_split(pair, resplit=True):
+            return no_resplit, None
+        return no_resplit, pending_ev(2, self.max_splits - 1, True, {})
+
+    def may_split(self, pair, resplit=False):
+        if self.max_splits < (2 if resplit else 1):
+            return False
+        if pair == ACE:
+            return self.can_split_aces and (self.resplit_aces or not resplit)
+        return True
+
+    def _stand_table(self, up, context):
+        key = (up, context)
+        table = self._stand_tables.get(key)
+        if table is None:
+            dealer = dealer_probabilities(up + 1, context, self.rules)
+            finals = dealer[:5]
+            table = [dealer.bust - (1 - dealer.bust)] * 17
+            for total in range(17, 22):
+                below = sum(finals[:total - 17])
+                above = sum(finals[total - 16:])
+                table.append(dealer.bust + below - above)
+            self._stand_tables[key] = table
+        return table
+
+    def _hand(self, hand, split=False, unlike_tens=False):
+        result = Hand()
+        result.is_split = split
+        for index, count in enumerate(hand):
+            for _ in range(count):
+                result.add_card(_CARDS[index])
+        if unlike_tens:
+            result.pop_card()
+            result.add_card(_OTHER_TEN)
+        return result
+
+    def _choose(self, evs, hand, up, phase, can_split=False, unlike_tens=False):
+        if self.strategy is None:
+            return max(evs.values())
+        player_hand = self._hand(hand, split=phase == SPLIT_TWO, unlike_tens=unlike_tens)
+        if phase == SPLIT_TWO:
+            # Resplits are handled in split_ev
+            player_hand.split_count = self.max_splits
+        action = self.strategy.decide_action(player_hand, _CARDS[up], self.rules)
+        if action == 'split' and not can_split:
+            raise ValueError("Strategy chose to split a hand that cannot be split here.")
+        if action not in evs:
+            raise ValueError(f"Strategy chose '{action}', which the rules do not allow here.")
+        return evs[action]
+
+
+# Test for HouseEdgeCalculator class
+if __name__ == "__main__":
+    import time
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    for strategy in (BasicStrategy(), None):
+        start = time.time()
+        calculator = HouseEdgeCalculator(rules, strategy)
+        edge = calculator.house_edge()
+        name = type(strategy).__name__ if strategy else 'Optimal play'
+        print(f"{name}: house edge {edge * 100:.3f}% ({time.time() - start:.1f}s)")
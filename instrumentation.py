@@ -0,0 +1,229 @@
+# instrumentation.py
+
+import cProfile
+import functools
+import io
+import pstats
+import time
+
+# Game methods timed by Instrumentation, in the order they run in a round
+GAME_PHASES = ('start_round', 'deal_initial_cards', 'check_for_blackjacks', 'player_actions',
+               'play_hand', 'dealer_actions', 'settle_bets', 'check_shoe')
+PHASES = GAME_PHASES[:5] + ('decide_action',) + GAME_PHASES[5:]
+
+
+class _InstrumentedStrategy:
+    """
+    Stands in for a player's strategy, forwarding everything to it and
+    timing decide_action.
+    """
+
+    def __init__(self, strategy, decide_action):
+        self.strategy = strategy
+        self.decide_action = decide_action
+
+    def __getattr__(self, name):
+        return getattr(self.strategy, name)
+
+
+class Instrumentation:
+    """
+    Records cumulative wall time and call counts for each phase of Game,
+    plus the number of shuffles and cards dealt.
+
+    attach() replaces the phase methods of one Game instance (and the
+    decide_action of each player's strategy) with timing wrappers, and
+    detach() removes them again. A Game that was never attached runs its
+    plain methods, so instrumentation costs nothing when it is off.
+
+    Times are inclusive: start_round contains every other phase and
+    player_actions contains play_hand and decide_action. Recursive calls
+    (play_hand for split hands) are counted but only timed once.
+    """
+
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.game = None
+        self.reset()
+
+    def reset(self):
+        # name -> [calls, elapsed_ns, depth]
+        self.phases = {name: [0, 0, 0] for name in PHASES}
+        self.shuffles = 0
+        self.cards_dealt = 0
+
+    def attach(self, game):
+        """
+        Instruments game and returns self.
+        """
+        if self.game is not None:
+            raise ValueError("Instrumentation is already attached to a game.")
+        self.game = game
+        for name in GAME_PHASES:
+            setattr(game, name, self._timed(name, getattr(game, name)))
+        for player in game.players:
+            if player.strategy is not None:
+                player.strategy = _InstrumentedStrategy(
+                    player.strategy, self._timed('decide_action', player.strategy.decide_action))
+        self._attach_shoe(game.shoe)
+        return self
+
+    def detach(self):
+        """
+        Restores the game's own methods and strategies.
+        """
+        game = self.game
+        if game is None:
+            return
+        for name in GAME_PHASES:
+            game.__dict__.pop(name, None)
+        for player in game.players:
+            if isinstance(player.strategy, _InstrumentedStrategy):
+                player.strategy = player.strategy.strategy
+        for name in ('deal_card', 'shuffle', 'reshuffle'):
+            game.shoe.__dict__.pop(name, None)
+        self.game = None
+
+    def _attach_shoe(self, shoe):
+        deal_card = shoe.deal_card
+        shuffle = shoe.shuffle
+        reshuffle = shoe.reshuffle
+        reshuffling = [False]
+
+        def counted_deal_card():
+            self.cards_dealt += 1
+            return deal_card()
+
+        def counted_shuffle():
+            # Deck.reshuffle calls shuffle; count that as one shuffle
+            if not reshuffling[0]:
+                self.shuffles += 1
+            return shuffle()
+
+        def counted_reshuffle():
+            self.shuffles += 1
+            reshuffling[0] = True
+            try:
+                return reshuffle()
+            finally:
+                reshuffling[0] = False
+
+        shoe.deal_card = functools.wraps(deal_card)(counted_deal_card)
+        shoe.shuffle = functools.wraps(shuffle)(counted_shuffle)
+        shoe.reshuffle = functools.wraps(reshuffle)(counted_reshuffle)
+
+    def _timed(self, name, function):
+        stats = self.phases[name]
+        clock = self.clock
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            stats[0] += 1
+            if stats[2]:
+                return function(*args, **kwargs)
+            stats[2] = 1
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats[1] += clock() - start
+                stats[2] = 0
+
+        return timed
+
+    def snapshot(self):
+        """
+        Returns the counters as a plain dict of phases, shuffles and cards dealt.
+        """
+        phases = {}
+        for name, (calls, elapsed_ns, _) in self.phases.items():
+            phases[name] = {
+                'calls': calls,
+                'seconds': elapsed_ns / 1e9,
+                'mean_ns': elapsed_ns / calls if calls else 0.0,
+            }
+        return {
+            'rounds': self.phases['start_round'][0],
+            'phases': phases,
+            'shuffles': self.shuffles,
+            'cards_dealt': self.cards_dealt,
+        }
+
+    def report(self):
+        """
+        Returns the snapshot formatted as a table, with each phase's share of start_round.
+        """
+        snapshot = self.snapshot()
+        total = snapshot['phases']['start_round']['seconds']
+        lines = [f"{'phase':<22}{'calls':>12}{'seconds':>12}{'mean ns':>12}{'share':>9}"]
+        for name, phase in snapshot['phases'].items():
+            share = phase['seconds'] / total if total else 0.0
+            lines.append(f"{name:<22}{phase['calls']:>12}{phase['seconds']:>12.4f}"
+                         f"{phase['mean_ns']:>12.0f}{share:>9.1%}")
+        lines.append(f"rounds {snapshot['rounds']}, shuffles {snapshot['shuffles']}, "
+                     f"cards dealt {snapshot['cards_dealt']}")
+        return '\n'.join(lines)
+
+
+def profile(game, rounds, path=None, sort='cumulative', limit=25, stream=None):
+    """
+    Plays rounds on game under cProfile and returns the pstats.Stats.
+
+    If path is given the raw profile is also written there, for pstats,
+    snakeviz or any other cProfile viewer. Pass stream to print the top
+    limit entries sorted by sort.
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(_play, game, rounds)
+    if path:
+        profiler.dump_stats(path)
+    stats = pstats.Stats(profiler, stream=stream or io.StringIO())
+    stats.sort_stats(sort)
+    if stream is not None:
+        stats.print_stats(limit)
+    return stats
+
+
+def _play(game, rounds):
+    for _ in range(rounds):
+        for player in game.players:
+            # Keep every seat funded so long runs never stop on a bankroll
+            if player.bankroll < game.table_limits[0] * 16:
+                player.bankroll = game.table_limits[0] * 16
+        game.start_round()
+
+
+# Phase breakdown and profile of a headless game
+if __name__ == "__main__":
+    import argparse
+    import random
+    import sys
+    from events import NullSink
+    from game import Game
+    from players import Player, Dealer
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    parser = argparse.ArgumentParser(description="Break a simulated game down by phase, or profile it.")
+    parser.add_argument('--rounds', type=int, default=20000)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--seats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--compact-shoe', action='store_true')
+    parser.add_argument('--profile', metavar='PATH', nargs='?', const='',
+                        help="run under cProfile instead; optionally write the profile to PATH")
+    args = parser.parse_args()
+
+    rules = Rules(number_of_decks=args.decks)
+    players = [Player(bankroll=0, strategy=BasicStrategy(rules), name=f"Seat_{seat}")
+               for seat in range(args.seats)]
+    game = Game(players=players, dealer=Dealer(), rules=rules, compact_shoe=args.compact_shoe,
+                event_sink=NullSink(), rng=random.Random(args.seed))
+    # A crowded table can run a small shoe dry mid-round
+    game.shoe.reshuffle_when_empty = True
+    if args.profile is not None:
+        profile(game, args.rounds, path=args.profile or None, stream=sys.stdout)
+    else:
+        instrumentation = game.instrument()
+        _play(game, args.rounds)
+        print(instrumentation.report())
@@ -0,0 +1,237 @@
+# optimal_strategy.py
+
+import os
+import struct
+from array import array
+
+from cards import COMPOSITION_SIZE
+from dealer_odds import ACE, TEN
+from house_edge import HouseEdgeCalculator
+from strategy import (TableStrategy, ACTIONS, HIT, STAND, SPLIT, NO_SPLIT,
+                      FIRST_TWO, SPLIT_TWO, LATER, PHASES, TOTALS, UP_CARDS, pair_index)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'blackjack-simulation', 'strategies')
+
+# Strategy cache files: magic, format version, generator version, then the
+# table lengths and the hard, soft and pair tables as signed bytes.
+CACHE_MAGIC = b'BJST'
+CACHE_VERSION = 2
+# Bump whenever generate_strategy or the table layout changes, so cached
+# tables from an older generator are regenerated instead of served
+GENERATOR_VERSION = 1
+_HEADER = struct.Struct('<4sBBHHH')
+TABLE_LENGTHS = (PHASES * TOTALS * UP_CARDS, PHASES * TOTALS * UP_CARDS, PHASES * UP_CARDS * UP_CARDS)
+
+
+def _without(composition, *indexes):
+    counts = list(composition)
+    for index in indexes:
+        counts[index] -= 1
+    return tuple(counts)
+
+
+def _hand(*indexes):
+    return tuple(indexes.count(index) for index in range(COMPOSITION_SIZE))
+
+
+def _value(index):
+    # Composition index to the card value used by the tables (Ace = 11)
+    return 11 if index == ACE else index + 1
+
+
+def _totals(hand):
+    hard = sum((index + 1) * count for index, count in enumerate(hand))
+    soft = hand[ACE] > 0 and hard <= 11
+    return ('soft' if soft else 'hard'), (hard + 10 if soft else hard), hard
+
+
+class _Cell:
+    """
+    Probability-weighted action EVs of every hand that maps to one table cell.
+    """
+
+    def __init__(self):
+        self.weight = 0.0
+        self.evs = None
+
+    def add(self, weight, evs):
+        self.weight += weight
+        if self.evs is None:
+            self.evs = {action: weight * ev for action, ev in evs.items()}
+        else:
+            # Keep only actions that every hand in the cell may take
+            self.evs = {action: self.evs[action] + weight * evs[action]
+                        for action in self.evs if action in evs}
+
+    def best(self):
+        return max(self.evs, key=self.evs.get)
+
+
+def generate_strategy(rules):
+    """
+    Derives a total-dependent optimal TableStrategy for the rules.
+
+    Each cell of the hard, soft and pair tables takes the action with the
+    highest EV averaged over every hand that reaches it, weighted by how
+    likely that hand is. First-two and split-hand cells average over
+    two-card hands; later cells average over three-card hands. Action EVs
+    come from HouseEdgeCalculator with optimal play downstream.
+    """
+    calculator = HouseEdgeCalculator(rules)
+    shoe = calculator.shoe
+    cells = {}
+
+    def cell(kind, phase, total, up):
+        return cells.setdefault((kind, phase, total, up), _Cell())
+
+    pair = [NO_SPLIT] * (PHASES * UP_CARDS * UP_CARDS)
+    for up in range(COMPOSITION_SIZE):
+        after_up = _without(shoe, up)
+        up_value = _value(up)
+        for first in range(COMPOSITION_SIZE):
+            for second in range(first, COMPOSITION_SIZE):
+                if {first, second} == {ACE, TEN}:
+                    continue
+                weight = after_up[first] * _without(after_up, first)[second]
+                if not weight:
+                    continue
+                composition = _without(after_up, first, second)
+                hand = _hand(first, second)
+                evs = calculator.action_evs(up, composition, composition, hand, FIRST_TWO)
+                kind, total, _ = _totals(hand)
+                cell(kind, FIRST_TWO, total, up_value).add(weight, evs)
+
+                # Later decisions: every third card that does not bust
+                for third in range(COMPOSITION_SIZE):
+                    third_weight = weight * composition[third]
+                    later_hand = _hand(first, second, third)
+                    kind, total, hard = _totals(later_hand)
+                    if not third_weight or hard > 21:
+                        continue
+                    later_evs = calculator.action_evs(up, composition, _without(composition, third),
+                                                      later_hand, LATER)
+                    cell(kind, LATER, total, up_value).add(third_weight, later_evs)
+
+            # Split hands: one card of the pair plus a new second card
+            pair_weight = after_up[first] * _without(after_up, first)[first]
+            if not pair_weight or not calculator.may_split(first):
+                continue
+            context = _without(after_up, first, first)
+            for second in range(COMPOSITION_SIZE):
+                if not context[second]:
+                    continue
+                hand = _hand(first, second)
+                evs = calculator.action_evs(up, context, _without(context, second), hand, SPLIT_TWO)
+                kind, total, _ = _totals(hand)
+                cell(kind, SPLIT_TWO, total, up_value).add(pair_weight * context[second], evs)
+
+            composition = _without(after_up, first, first)
+            evs = calculator.action_evs(up, composition, composition, _hand(first, first), FIRST_TWO)
+            no_resplit, resplit = calculator.split_evs(first, up)
+            if max(no_resplit, resplit if resplit is not None else no_resplit) > max(evs.values()):
+                pair[pair_index(FIRST_TWO, _value(first), up_value)] = SPLIT
+                if resplit is not None and resplit > no_resplit:
+                    pair[pair_index(SPLIT_TWO, _value(first), up_value)] = SPLIT
+
+    def decide(kind, phase, total, up_value):
+        if kind == 'pair':
+            return pair[pair_index(phase, total, up_value)]
+        found = cells.get((kind, phase, total, up_value))
+        if found is None and phase != FIRST_TWO:
+            # Unreachable in this phase; fall back to the first-two hit/stand choice
+            found = cells.get((kind, FIRST_TWO, total, up_value))
+            if found is not None:
+                return HIT if found.evs['hit'] > found.evs['stand'] else STAND
+        if found is None:
+            return HIT if total < 12 else STAND
+        return ACTIONS.index(found.best())
+
+    return TableStrategy.from_function(decide)
+
+
+def cache_path(rules, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, f"{rules.stable_hash()}-g{GENERATOR_VERSION}.bjs")
+
+
+def save_strategy(strategy, path):
+    """
+    Writes a TableStrategy to path atomically in the compact cache format.
+    """
+    tables = [array('b', table).tobytes() for table in (strategy.hard, strategy.soft, strategy.pair)]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, GENERATOR_VERSION, *(len(table) for table in tables)))
+        for table in tables:
+            file.write(table)
+    os.replace(temporary, path)
+
+
+def load_strategy(path):
+    """
+    Reads a TableStrategy written by save_strategy. Returns None if the file
+    is missing. Raises ValueError if it is not a strategy file, was written
+    by another format or generator version, or its tables do not have the
+    sizes TableStrategy indexes.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < _HEADER.size:
+        raise ValueError(f"{path} is truncated.")
+    magic, version, generator, *lengths = _HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC:
+        raise ValueError(f"{path} is not a strategy file.")
+    if version != CACHE_VERSION or generator != GENERATOR_VERSION:
+        raise ValueError(f"{path} was written by format {version}, generator {generator}; "
+                         f"expected format {CACHE_VERSION}, generator {GENERATOR_VERSION}.")
+    if tuple(lengths) != TABLE_LENGTHS:
+        raise ValueError(f"{path} has tables of {lengths} entries; expected {list(TABLE_LENGTHS)}.")
+    if len(data) != _HEADER.size + sum(lengths):
+        raise ValueError(f"{path} is truncated.")
+    tables = []
+    offset = _HEADER.size
+    for length in lengths:
+        tables.append(array('b', data[offset:offset + length]))
+        offset += length
+    return TableStrategy(*tables)
+
+
+def optimal_strategy(rules, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Returns the optimal TableStrategy for the rules, generating it and
+    saving it to cache_dir the first time a rule set is seen. An unreadable
+    cache file is regenerated.
+    """
+    path = cache_path(rules, cache_dir)
+    try:
+        strategy = load_strategy(path)
+    except ValueError:
+        strategy = None
+    if strategy is None:
+        strategy = generate_strategy(rules)
+        save_strategy(strategy, path)
+    return strategy
+
+
+# Test for the optimal strategy generator
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules(surrender_allowed='late')
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for attempt in ('generated', 'loaded'):
+            start = time.time()
+            strategy = optimal_strategy(rules, cache_dir)
+            print(f"Strategy {attempt} in {time.time() - start:.3f}s")
+
+    basic = BasicStrategy(rules)
+    differences = [index for index, (a, b) in enumerate(zip(strategy.hard, basic.hard)) if a != b]
+    print(f"Hard cells that differ from BasicStrategy: {len(differences)}")
+    calculator = HouseEdgeCalculator(rules, strategy)
+    print(f"House edge with the generated strategy: {calculator.house_edge() * 100:.3f}%")
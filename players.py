@@ -6,17 +6,26 @@ class Player:
     Represents a player in the game.
     """
 
+    __slots__ = ('hands', 'bankroll', 'strategy', 'name', 'hand_pool')
+
     def __init__(self, bankroll=1000, strategy=None, name="Player"):
         self.hands = []
         self.bankroll = bankroll
         self.strategy = strategy
         self.name = name
+        # A HandPool to reuse hands from (see Game's pool_hands), or None
+        self.hand_pool = None
+
+    def new_hand(self, bet=0):
+        if self.hand_pool is not None:
+            return self.hand_pool.acquire(bet)
+        return Hand(bet=bet)
 
     def place_bet(self, amount):
         if amount > self.bankroll:
             raise ValueError("Bet amount exceeds bankroll.")
         self.bankroll -= amount
-        hand = Hand(bet=amount)
+        hand = self.new_hand(amount)
         self.hands.append(hand)
         return hand
 
@@ -32,9 +41,16 @@ class Player:
     def split_hand(self, hand):
         if len(hand.cards) != 2:
             raise ValueError("Cannot split hand that doesn't have exactly two cards.")
-        new_hand = Hand(bet=hand.bet)
-        new_hand.add_card(hand.cards.pop())
+        if hand.bet > self.bankroll:
+            raise ValueError("Insufficient bankroll to split.")
+        self.bankroll -= hand.bet
+        new_hand = self.new_hand(hand.bet)
+        new_hand.add_card(hand.pop_card())
+        hand.is_split = new_hand.is_split = True
         self.hands.append(new_hand)
+        # Resplit limits apply to the seat, so every hand sees the new count
+        for seat_hand in self.hands:
+            seat_hand.split_count = len(self.hands) - 1
         return new_hand
 
     def double_down(self, hand):
@@ -51,7 +67,11 @@ class Player:
         self.bankroll += refund
 
     def clear_hands(self):
-        self.hands = []
+        if self.hand_pool is not None:
+            self.hand_pool.release(self.hands)
+            self.hands.clear()
+        else:
+            self.hands = []
 
 
 class Dealer(Player):
@@ -59,6 +79,8 @@ class Dealer(Player):
     Represents the dealer in the game.
     """
 
+    __slots__ = ()
+
     def __init__(self, name="Dealer"):
         super().__init__(bankroll=float('inf'), strategy=None, name=name)
 
@@ -68,15 +90,12 @@ class Dealer(Player):
             self.receive_card(hand, card)
 
     def must_hit(self, hand, rules):
-        value = hand.get_best_value()
+        value = hand.best_value
         if value < 17:
             return True
         elif value == 17:
-            if rules.dealer_hits_soft_17:
-                # Check if hand is soft (contains an Ace counted as 11)
-                values = hand.get_values()
-                if any(v == 17 for v in values) and any(card.rank == 'A' for card in hand.cards):
-                    return True
+            # Hit a soft 17 (an Ace counted as 11) if the rules say so
+            return rules.dealer_hits_soft_17 and hand.is_soft()
         return False
 
 # Test for Player class
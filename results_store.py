@@ -0,0 +1,325 @@
+# results_store.py
+
+import glob
+import json
+import math
+import operator
+import os
+import struct
+
+import numpy as np
+
+from events import OUTCOMES
+from strategy import ACTION_FLAGS
+
+STORE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+# One row per settled hand; columns are saved as separate .npy files per segment
+ROW_DTYPE = np.dtype([
+    ('round', '<u4'),
+    ('seat', 'u1'),
+    ('dealer_up', 'u1'),
+    ('initial_bet', '<f4'),
+    ('final_bet', '<f4'),
+    ('actions', 'u1'),
+    ('player_total', 'u1'),
+    ('dealer_total', 'u1'),
+    ('outcome', 'u1'),
+    ('net', '<f4'),
+])
+COLUMNS = ROW_DTYPE.names
+_ROW = struct.Struct('<IBBffBBBBf')
+assert _ROW.size == ROW_DTYPE.itemsize
+
+# The actions column holds Hand.action_flags: one bit per action taken,
+# e.g. row['actions'] & ACTION_FLAGS['double']
+OUTCOME_CODES = {name: code for code, name in enumerate(OUTCOMES)}
+
+# Predicate operators: (column, op, value). '&' matches rows with any of value's bits set.
+_OPS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge,
+    'in': lambda column, values: np.isin(column, list(values)),
+    '&': lambda column, bits: (column & bits) != 0,
+}
+
+
+def _may_match(low, high, op, value):
+    # Whether a segment whose column lies in [low, high] can have matching rows
+    if op == '==':
+        return low <= value <= high
+    if op == '!=':
+        return not low == high == value
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    if op == 'in':
+        return any(low <= item <= high for item in value)
+    return high != 0
+
+
+def _write_json(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return {'version': STORE_VERSION, 'columns': {name: ROW_DTYPE[name].str for name in COLUMNS},
+                'segments': []}
+    if manifest.get('version') != STORE_VERSION:
+        raise ValueError(f"{directory} was written by an unsupported store version ({manifest.get('version')}).")
+    return manifest
+
+
+class ResultsRecorder:
+    """
+    Appends one row per settled hand of a Game to a columnar results store
+    in directory.
+
+    attach() sets the game's settle_hook, so the recorder runs once per
+    settled hand and needs no events: the round, dealer cards and the
+    hand's action flags are read from the game and the hand. Rows are
+    packed into a buffer of segment_rows and written as one .npy file per
+    column when it fills, so memory stays bounded however many rows are
+    collected. Each segment is added to the manifest (with run, a dict of
+    JSON values such as rules.to_dict() and the seed, and the min and max
+    of every column) only after its files are written, so readers never
+    see a partial segment. Call close() (or use the recorder as a context
+    manager) to write the last partial segment. Only one recorder should
+    write to a directory at a time.
+
+    Seats are numbered in the order of game.players.
+    """
+
+    def __init__(self, directory, run=None, segment_rows=1 << 20):
+        self.directory = directory
+        self.run = dict(run or {})
+        self.segment_rows = segment_rows
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = _load_manifest(directory)
+        self.buffer = bytearray(segment_rows * _ROW.size)
+        self.pending = 0
+        self.rows = 0
+        self.closed = False
+        self.game = None
+        self.seats = {}
+        self.round = None
+        self.dealer_up = 0
+        self.dealer_total = 0
+
+    def attach(self, game):
+        """
+        Starts recording game's hands and returns self.
+        """
+        if self.game is not None:
+            raise ValueError("ResultsRecorder is already attached to a game.")
+        if game.settle_hook is not None:
+            raise ValueError("The game already has a settle_hook.")
+        self.game = game
+        self.seats = {player: seat for seat, player in enumerate(game.players)}
+        self.round = None
+        game.settle_hook = self.record
+        return self
+
+    def detach(self):
+        if self.game is not None:
+            self.game.settle_hook = None
+            self.game = None
+
+    def record(self, player, hand, result, net):
+        game = self.game
+        if game.current_round != self.round:
+            # The dealer's hand is final once hands are being settled
+            self.round = game.current_round
+            dealer_hand = game.dealer.hands[0]
+            self.dealer_up = dealer_hand.cards[0].get_value()
+            self.dealer_total = min(dealer_hand.best_value, 255)
+        bet = hand.bet
+        _ROW.pack_into(
+            self.buffer, self.pending * _ROW.size,
+            self.round, self.seats[player], self.dealer_up, bet / 2 if hand.is_double_down else bet, bet,
+            hand.action_flags, min(hand.best_value, 255), self.dealer_total, OUTCOME_CODES[result], net)
+        self.pending += 1
+        self.rows += 1
+        if self.pending == self.segment_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows as a new segment.
+        """
+        if not self.pending:
+            return
+        rows = np.frombuffer(self.buffer, dtype=ROW_DTYPE, count=self.pending)
+        segments = self.manifest['segments']
+        # Number past any segment files left behind by an interrupted writer
+        number = len(segments)
+        while glob.glob(os.path.join(self.directory, f"{number:06d}.*.npy")):
+            number += 1
+        name = f"{number:06d}"
+        stats = {}
+        for column in COLUMNS:
+            values = rows[column]
+            np.save(os.path.join(self.directory, f"{name}.{column}.npy"), values)
+            stats[column] = [values.min().item(), values.max().item()]
+        segments.append({'name': name, 'rows': self.pending, 'run': self.run, 'stats': stats})
+        _write_json(os.path.join(self.directory, MANIFEST), self.manifest)
+        self.pending = 0
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.detach()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ResultsStore:
+    """
+    Read-only view of a results store written by ResultsRecorder.
+
+    Queries take where, a sequence of (column, op, value) predicates (ops
+    ==, !=, <, <=, >, >=, in and & for action flags), and run, a dict that
+    a segment's run metadata must match. Both are pushed down: segments
+    whose run or column min/max rule out a match are skipped without being
+    read, only the columns a query needs are opened, and they are
+    memory-mapped, so queries work one segment at a time out of core.
+    """
+
+    def __init__(self, directory):
+        if not os.path.exists(os.path.join(directory, MANIFEST)):
+            raise ValueError(f"{directory} is not a results store.")
+        self.directory = directory
+        self.manifest = _load_manifest(directory)
+
+    def __len__(self):
+        return sum(segment['rows'] for segment in self.manifest['segments'])
+
+    def segments(self, where=(), run=None):
+        """
+        Returns the manifest entries of the segments that may hold matching rows.
+        """
+        for column, op, _ in where:
+            if column not in COLUMNS:
+                raise ValueError(f"Unknown column '{column}'.")
+            if op not in _OPS:
+                raise ValueError(f"Unknown operator '{op}'.")
+        selected = []
+        for segment in self.manifest['segments']:
+            if run and any(segment['run'].get(key) != value for key, value in run.items()):
+                continue
+            stats = segment['stats']
+            if all(_may_match(*stats[column], op, value) for column, op, value in where):
+                selected.append(segment)
+        return selected
+
+    def column(self, segment, name):
+        return np.load(os.path.join(self.directory, f"{segment['name']}.{name}.npy"), mmap_mode='r')
+
+    def scan(self, columns=COLUMNS, where=(), run=None):
+        """
+        Yields a dict of column arrays with the matching rows of each segment.
+        """
+        for segment in self.segments(where, run):
+            mask = None
+            for column, op, value in where:
+                matches = _OPS[op](self.column(segment, column), value)
+                mask = matches if mask is None else mask & matches
+            if mask is None:
+                yield {name: self.column(segment, name) for name in columns}
+            elif mask.any():
+                yield {name: np.asarray(self.column(segment, name))[mask] for name in columns}
+
+    def count(self, where=(), run=None):
+        return sum(len(data['net']) for data in self.scan(('net',), where, run))
+
+    def ev_by(self, key, where=(), run=None, per_bet=True):
+        """
+        Returns (key value, hands, ev, stderr) per value of a small integer
+        column such as dealer_up, player_total, outcome or seat. EV is net
+        per initial bet, or net in money when per_bet is False.
+        """
+        if ROW_DTYPE[key] != np.dtype('u1'):
+            raise ValueError(f"Cannot group by '{key}'; choose a one-byte column.")
+        hands = np.zeros(256)
+        total = np.zeros(256)
+        total_squared = np.zeros(256)
+        columns = (key, 'net', 'initial_bet') if per_bet else (key, 'net')
+        for data in self.scan(columns, where, run):
+            values = np.asarray(data['net'], dtype=np.float64)
+            if per_bet:
+                values = values / data['initial_bet']
+            keys = data[key]
+            hands += np.bincount(keys, minlength=256)
+            total += np.bincount(keys, weights=values, minlength=256)
+            total_squared += np.bincount(keys, weights=values * values, minlength=256)
+        rows = []
+        for value in np.flatnonzero(hands):
+            count = hands[value]
+            ev = total[value] / count
+            variance = max(total_squared[value] / count - ev * ev, 0.0)
+            rows.append((int(value), int(count), ev, math.sqrt(variance / count)))
+        return rows
+
+
+# Test for the columnar results store
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+    from events import NullSink
+    from game import Game
+    from players import Player, Dealer
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    def play(rules, rounds, seed, recorder=None):
+        player = Player(bankroll=0, strategy=BasicStrategy(rules), name="Recorded")
+        game = Game(players=[player], dealer=Dealer(), rules=rules, compact_shoe=True, event_sink=NullSink(),
+                    rng=random.Random(seed), pool_hands=True)
+        if recorder is not None:
+            recorder.attach(game)
+        start = time.time()
+        for _ in range(rounds):
+            player.bankroll = 160.0
+            game.start_round()
+        return time.time() - start
+
+    rounds = 100000
+    with tempfile.TemporaryDirectory() as directory:
+        for h17 in (False, True):
+            rules = Rules(dealer_hits_soft_17=h17)
+            baseline = play(rules, rounds, 1)
+            with ResultsRecorder(directory, run=dict(rules.to_dict(), seed=1), segment_rows=1 << 16) as recorder:
+                elapsed = play(rules, rounds, 1, recorder)
+            print(f"H17={h17}: {recorder.rows} rows in {elapsed:.2f}s (without recording {baseline:.2f}s)")
+
+        store = ResultsStore(directory)
+        h17 = {'dealer_hits_soft_17': True}
+        print(f"{len(store)} rows in {len(store.manifest['segments'])} segments, "
+              f"{len(store.segments(run=h17))} of them H17")
+        print("H17 EV by dealer up card:")
+        for up, hands, ev, stderr in store.ev_by('dealer_up', run=h17):
+            print(f"  {up:2}: {hands:6} hands, EV {ev:+.4f} +/- {stderr:.4f}")
+        doubled = store.count(where=[('actions', '&', ACTION_FLAGS['double'])], run=h17)
+        print(f"H17 doubled hands: {doubled}")
+        late = [('round', '>', 90000)]
+        skipped = len(store.manifest['segments']) - len(store.segments(where=late))
+        print(f"Rounds after 90000: {store.count(where=late)} rows, {skipped} segments skipped")
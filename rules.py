@@ -1,5 +1,8 @@
 # rules.py
 
+import hashlib
+import json
+
 class Rules:
     """
     Encapsulates all game rule variations.
@@ -37,6 +40,45 @@ class Rules:
         # Add validation logic if necessary
         pass
 
+    def key(self):
+        """
+        Returns a hashable tuple identifying this rule configuration.
+        """
+        return (
+            self.blackjack_payout,
+            self.number_of_decks,
+            self.dealer_hits_soft_17,
+            tuple(sorted(self.double_down_allowed_on)),
+            self.double_after_split_allowed,
+            tuple(sorted(self.splitting_rules.items())),
+            self.surrender_allowed,
+            self.insurance_offered,
+            self.insurance_payout,
+        )
+
+    def to_dict(self):
+        """
+        Returns the rules as keyword arguments for Rules(**data).
+        """
+        return {
+            'blackjack_payout': self.blackjack_payout,
+            'number_of_decks': self.number_of_decks,
+            'dealer_hits_soft_17': self.dealer_hits_soft_17,
+            'double_down_allowed_on': sorted(self.double_down_allowed_on),
+            'double_after_split_allowed': self.double_after_split_allowed,
+            'splitting_rules': dict(self.splitting_rules),
+            'surrender_allowed': self.surrender_allowed,
+            'insurance_offered': self.insurance_offered,
+            'insurance_payout': self.insurance_payout,
+        }
+
+    def stable_hash(self):
+        """
+        Returns a hex digest of the rules that is stable across processes and runs.
+        """
+        encoded = json.dumps(self.to_dict(), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:20]
+
 
 # Test for Rules class
 if __name__ == "__main__":
@@ -0,0 +1,455 @@
+# server.py
+
+import asyncio
+import itertools
+from collections import deque
+import json
+import random
+import time
+
+from cards import Card
+from events import NullSink
+from game import Game
+from hand import Hand
+from players import Player, Dealer
+from rules import Rules
+from strategy import BasicStrategy
+
+# Work done per event loop pass when waking or starting many tables at once,
+# so a batch of thousands of answers does not stall other connections
+SLICE = 64
+# Most tables one connection may hold open
+MAX_TABLES_PER_CONNECTION = 10000
+
+
+class AsyncGame(Game):
+    """
+    A Game whose player decisions can be awaited.
+
+    A strategy that defines decide_action_async(hand, dealer_up_card, rules)
+    returning an awaitable is awaited, with decision_timeout seconds to
+    answer; when it times out the table's timeout_strategy decides instead.
+    Strategies without it are called directly, so local bots never wait on
+    the event loop.
+    """
+
+    def __init__(self, players, dealer, rules, decision_timeout=30.0, timeout_strategy=None, **kwargs):
+        kwargs.setdefault('event_sink', NullSink())
+        super().__init__(players, dealer, rules, **kwargs)
+        self.decision_timeout = decision_timeout
+        self.timeout_strategy = timeout_strategy if timeout_strategy is not None else BasicStrategy(rules)
+
+    async def play_round(self):
+        self.begin_round()
+        if not self.round_over:
+            for player in self.players:
+                for hand in player.hands:
+                    if not hand.is_complete:
+                        await self.play_hand_async(player, hand)
+            self.dealer_actions()
+        self.finish_round()
+
+    async def play_hand_async(self, player, hand):
+        hand.is_complete = True
+        while True:
+            action = await self.decide(player, hand)
+            outcome = self.apply_action(player, hand, action)
+            if outcome is None:
+                outcome = self.apply_action(player, hand, self.fallback_action(action))
+            if outcome is False:
+                continue
+            if outcome is not True:
+                await self.play_hand_async(player, hand)
+                await self.play_hand_async(player, outcome)
+            return
+
+    async def decide(self, player, hand):
+        up_card = self.dealer_up_card()
+        decide_async = getattr(player.strategy, 'decide_action_async', None)
+        if decide_async is None:
+            return player.decide_action(hand, up_card, self.rules)
+        # A timer cancels the decision instead of wait_for, which would wrap
+        # every decision in a new task
+        decision = asyncio.ensure_future(decide_async(hand, up_card, self.rules))
+        timed_out = []
+
+        def expire():
+            timed_out.append(True)
+            decision.cancel()
+
+        timer = asyncio.get_running_loop().call_later(self.decision_timeout, expire)
+        try:
+            return await decision
+        except asyncio.CancelledError:
+            if not timed_out:
+                raise
+        finally:
+            timer.cancel()
+        if self.events.enabled:
+            self.events.emit('decision_timeout', player=player, hand=hand)
+        return self.timeout_strategy.decide_action(hand, up_card, self.rules)
+
+
+def hand_state(hand):
+    """
+    Returns the JSON-ready description of a hand sent with a decision request.
+    """
+    return {
+        'cards': [card.rank for card in hand.cards],
+        'value': hand.get_best_value(),
+        'soft': hand.is_soft(),
+        'split': hand.is_split,
+        'split_count': hand.split_count,
+    }
+
+
+def hand_from_state(state):
+    """
+    Rebuilds a Hand from hand_state() so a client can ask a local strategy.
+    """
+    hand = Hand()
+    for rank in state['cards']:
+        hand.add_card(Card(rank, 'Spades'))
+    hand.is_split = state['split']
+    hand.split_count = state['split_count']
+    return hand
+
+
+class Connection:
+    """
+    One client connection. Decision requests and round results for all of
+    the client's tables are queued and written together once per event
+    loop pass, so a bot playing thousands of tables gets them in batches.
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.name = None
+        self.tables = []
+        self.pending = {}
+        self.requests = []
+        self.results = []
+        self.flush_scheduled = False
+        self.answers = deque()
+        self.draining = False
+        self.request_ids = itertools.count()
+
+    def request_decision(self, table_id, hand, up_card):
+        # Answers pop their request; the callback also drops requests that timed out
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        future.add_done_callback(lambda _: self.pending.pop(request_id, None))
+        self.requests.append({'id': request_id, 'table': table_id, 'hand': hand_state(hand),
+                              'dealer_up': up_card.rank})
+        self._schedule_flush()
+        return future
+
+    def send_result(self, result):
+        self.results.append(result)
+        self._schedule_flush()
+
+    def send(self, message):
+        self.writer.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+
+    def _schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self.flush_scheduled = False
+        if self.writer.is_closing():
+            return
+        if self.requests:
+            self.send({'type': 'decide', 'requests': self.requests})
+            self.requests = []
+        if self.results:
+            self.send({'type': 'results', 'results': self.results})
+            self.results = []
+
+    def answer(self, actions):
+        if not isinstance(actions, dict):
+            self.send({'type': 'error', 'message': "actions must map request ids to actions."})
+            return
+        invalid = []
+        for request_id, action in actions.items():
+            try:
+                self.answers.append((int(request_id), action))
+            except ValueError:
+                invalid.append(request_id)
+        if invalid:
+            self.send({'type': 'error', 'message': f"Unknown request ids: {', '.join(invalid)}."})
+        if self.answers and not self.draining:
+            self.draining = True
+            asyncio.get_running_loop().call_soon(self._drain)
+
+    def _drain(self):
+        # Wake SLICE tables per loop pass; each continues its round when resumed
+        answers = self.answers
+        try:
+            for _ in range(min(SLICE, len(answers))):
+                request_id, action = answers.popleft()
+                future = self.pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(action)
+        finally:
+            if answers:
+                asyncio.get_running_loop().call_soon(self._drain)
+            else:
+                self.draining = False
+
+    def close(self):
+        for future in self.pending.values():
+            if not future.done():
+                future.cancel()
+        self.pending.clear()
+        for task in self.tables:
+            task.cancel()
+
+
+class RemoteStrategy:
+    """
+    Strategy for a seat played by a client; decisions travel over its Connection.
+    """
+
+    def __init__(self, connection, table_id):
+        self.connection = connection
+        self.table_id = table_id
+
+    def decide_action(self, hand, dealer_up_card, rules):
+        raise NotImplementedError("RemoteStrategy decisions must be awaited (see AsyncGame).")
+
+    def decide_action_async(self, hand, dealer_up_card, rules):
+        return self.connection.request_decision(self.table_id, hand, dealer_up_card)
+
+
+class TableServer:
+    """
+    Hosts any number of single-seat AsyncGame tables for clients speaking
+    JSON lines over TCP.
+
+    Client messages:
+        {"type": "join", "name": "bot", "tables": 100, "rounds": 50, "bankroll": 1000}
+        {"type": "actions", "actions": {"<request id>": "hit", ...}}
+        {"type": "leave"}
+    Server messages:
+        {"type": "joined", "tables": [ids], "rules": {...}}
+        {"type": "decide", "requests": [{"id", "table", "hand", "dealer_up"}, ...]}
+        {"type": "results", "results": [{"table", "round", "net", "bankroll"}, ...]}
+        {"type": "table_closed", "table": id, "reason": "..."}
+        {"type": "error", "message": "..."}
+
+    "rounds" is optional; without it a table plays until the client leaves
+    or its bankroll cannot cover the minimum bet. A human can play with any
+    line-oriented tool such as nc.
+    """
+
+    def __init__(self, rules=None, decision_timeout=30.0, table_limits=(10, 1000), seed=None):
+        self.rules = rules if rules is not None else Rules()
+        self.decision_timeout = decision_timeout
+        self.table_limits = table_limits
+        self.seed = seed
+        self.table_ids = itertools.count()
+        self.open_tables = 0
+        self.rounds_played = 0
+        self.server = None
+        self.connections = set()
+        self.timeout_strategy = BasicStrategy(self.rules)
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=1 << 24)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for connection in list(self.connections):
+                connection.close()
+                connection.writer.close()
+            await self.server.wait_closed()
+            # Let the connection handlers see end of file and finish
+            while self.connections:
+                await asyncio.sleep(0)
+
+    async def handle(self, reader, writer):
+        connection = Connection(self, reader, writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message['type']
+                except (ValueError, KeyError, TypeError):
+                    connection.send({'type': 'error', 'message': "Messages must be JSON objects with a type."})
+                    continue
+                if kind == 'actions':
+                    connection.answer(message.get('actions', {}))
+                elif kind == 'join':
+                    await self.join(connection, message)
+                elif kind == 'leave':
+                    break
+                else:
+                    connection.send({'type': 'error', 'message': f"Unknown message type '{kind}'."})
+        finally:
+            self.connections.discard(connection)
+            connection.close()
+            writer.close()
+
+    async def join(self, connection, message):
+        try:
+            tables = int(message.get('tables', 1))
+            rounds = message.get('rounds')
+            rounds = None if rounds is None else int(rounds)
+            bankroll = float(message.get('bankroll', 1000))
+        except (ValueError, TypeError):
+            connection.send({'type': 'error', 'message': "tables, rounds and bankroll must be numbers."})
+            return
+        available = MAX_TABLES_PER_CONNECTION - len(connection.tables)
+        if not 0 < tables <= available:
+            connection.send({'type': 'error', 'message': f"tables must be between 1 and {available}."})
+            return
+        connection.name = str(message.get('name', 'Player'))
+        ids = [next(self.table_ids) for _ in range(tables)]
+        connection.send({'type': 'joined', 'tables': ids, 'rules': self.rules.to_dict()})
+        loop = asyncio.get_running_loop()
+        for index, table_id in enumerate(ids):
+            if index and not index % SLICE:
+                await asyncio.sleep(0)
+            task = loop.create_task(self.run_table(connection, table_id, rounds, bankroll))
+            connection.tables.append(task)
+
+    async def run_table(self, connection, table_id, rounds, bankroll):
+        player = Player(bankroll=bankroll, strategy=RemoteStrategy(connection, table_id),
+                        name=f"{connection.name}_{table_id}")
+        rng = random.Random(f"{self.seed}/{table_id}") if self.seed is not None else None
+        game = AsyncGame([player], Dealer(), self.rules, decision_timeout=self.decision_timeout,
+                         timeout_strategy=self.timeout_strategy, table_limits=self.table_limits, compact_shoe=True, rng=rng)
+        self.open_tables += 1
+        reason = 'finished'
+        try:
+            played = 0
+            while rounds is None or played < rounds:
+                if player.bankroll < self.table_limits[0]:
+                    reason = 'bankroll'
+                    break
+                before = player.bankroll
+                await game.play_round()
+                played += 1
+                self.rounds_played += 1
+                connection.send_result({'table': table_id, 'round': game.current_round,
+                                        'net': player.bankroll - before, 'bankroll': player.bankroll})
+        except asyncio.CancelledError:
+            reason = 'disconnected'
+            raise
+        except Exception as error:
+            # e.g. a split or double the bankroll cannot cover; close this table, not the server
+            reason = str(error) or type(error).__name__
+        finally:
+            self.open_tables -= 1
+            if reason != 'disconnected' and not connection.writer.is_closing():
+                connection._flush()
+                connection.send({'type': 'table_closed', 'table': table_id, 'reason': reason})
+
+
+async def run_bot_client(host, port, tables=1, rounds=10, strategy=None, name='bot'):
+    """
+    Connects a bot that plays every table with a local strategy (BasicStrategy
+    by default), answering each batch of decision requests in one message.
+    Returns a dict of rounds played, net result, decisions and latency.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 24)
+    writer.write(json.dumps({'type': 'join', 'name': name, 'tables': tables, 'rounds': rounds,
+                             'bankroll': 10 ** 9}).encode() + b'\n')
+    rules = None
+    open_tables = None
+    summary = {'rounds': 0, 'net': 0.0, 'decisions': 0, 'batches': 0}
+    while open_tables is None or open_tables:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'joined':
+            rules = Rules(**message['rules'])
+            strategy = strategy if strategy is not None else BasicStrategy(rules)
+            open_tables = len(message['tables'])
+        elif kind == 'decide':
+            actions = {}
+            for index, request in enumerate(message['requests']):
+                if index and not index % SLICE:
+                    await asyncio.sleep(0)
+                hand = hand_from_state(request['hand'])
+                actions[request['id']] = strategy.decide_action(hand, Card(request['dealer_up'], 'Spades'), rules)
+            summary['decisions'] += len(actions)
+            summary['batches'] += 1
+            writer.write(json.dumps({'type': 'actions', 'actions': actions}).encode() + b'\n')
+        elif kind == 'results':
+            for result in message['results']:
+                summary['rounds'] += 1
+                summary['net'] += result['net']
+        elif kind == 'table_closed':
+            open_tables -= 1
+    writer.write(b'{"type":"leave"}\n')
+    writer.close()
+    return summary
+
+
+async def _responsiveness(interval=0.01, stop=None):
+    # Longest gap between timer ticks: how long the loop was blocked
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    last = loop.time()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = loop.time()
+        worst = max(worst, now - last - interval)
+        last = now
+    return worst
+
+
+async def _demo(tables, rounds, timeout):
+    server = TableServer(decision_timeout=timeout, seed=1)
+    host, port = await server.start()
+    stop = asyncio.Event()
+    monitor = asyncio.get_running_loop().create_task(_responsiveness(stop=stop))
+    start = time.perf_counter()
+    summary = await run_bot_client(host, port, tables=tables, rounds=rounds)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_stall = await monitor
+    await server.close()
+    print(f"{tables} tables, {summary['rounds']} rounds in {elapsed:.2f}s "
+          f"({summary['rounds'] / elapsed:.0f} rounds/s), {summary['decisions']} decisions "
+          f"in {summary['batches']} batches, net {summary['net']:+.0f}, "
+          f"longest loop stall {worst_stall * 1000:.1f} ms")
+
+
+# Serve tables, or run a local bot client against an in-process server
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Asyncio multi-table Blackjack server.")
+    parser.add_argument('command', choices=('serve', 'demo'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tables', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds allowed per decision")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        async def serve():
+            server = TableServer(decision_timeout=args.timeout)
+            host, port = await server.start(args.host, args.port)
+            print(f"Serving on {host}:{port}")
+            await server.server.serve_forever()
+
+        asyncio.run(serve())
+    else:
+        asyncio.run(_demo(args.tables, args.rounds, args.timeout))
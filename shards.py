@@ -0,0 +1,386 @@
+# shards.py
+
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+from events import EventSink
+from rules import Rules
+from simulation import RESULTS, RunningStats, chunk_game, play_rounds
+from strategy import ACTIONS, STRATEGIES, make_strategy
+
+
+def job_spec(rules, strategy='basic', seed=0, rounds=1000000, chunk_rounds=100000):
+    """
+    Returns a JSON-ready description of a seeded simulation: the rules, a
+    strategy name from strategy.STRATEGIES, the seed and the round budget.
+    Chunk i plays min(chunk_rounds, rounds left) rounds from chunk_rng(seed, i),
+    exactly as run_simulation does.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'; choose from {', '.join(STRATEGIES)}.")
+    return {'rules': rules.to_dict(), 'strategy': strategy, 'seed': seed, 'rounds': rounds,
+            'chunk_rounds': chunk_rounds}
+
+
+def spec_id(spec):
+    fields = {name: spec[name] for name in ('rules', 'strategy', 'seed', 'rounds', 'chunk_rounds')}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_count(spec):
+    return math.ceil(spec['rounds'] / spec['chunk_rounds'])
+
+
+def split_spec(spec, shards):
+    """
+    Splits a job spec into at most shards shard specs, each covering a
+    contiguous range of chunks.
+    """
+    chunks = chunk_count(spec)
+    shards = max(min(shards, chunks), 1)
+    size, extra = divmod(chunks, shards)
+    result = []
+    start = 0
+    for index in range(shards):
+        stop = start + size + (index < extra)
+        result.append(dict(spec, id=spec_id(spec), shard=index, shards=shards, chunks=[start, stop]))
+        start = stop
+    return result
+
+
+def shard_id(shard):
+    start, stop = shard['chunks']
+    return f"{shard['id']}-{start:06d}-{stop:06d}"
+
+
+class ShardResult:
+    """
+    The results of one shard: a histogram of per-round net results (in
+    table-minimum units), hand outcome counts and action counts.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.nets = {}
+        self.counts = dict.fromkeys(RESULTS, 0)
+        self.actions = dict.fromkeys(ACTIONS, 0)
+        # Lets play_rounds treat a result like RunningStats; counts are not tracked
+        self.true_counts = None
+
+    def add(self, net):
+        self.nets[net] = self.nets.get(net, 0) + 1
+
+    def to_dict(self):
+        return {'chunks': self.chunks,
+                'nets': {repr(net): rounds for net, rounds in sorted(self.nets.items())},
+                'counts': self.counts, 'actions': self.actions}
+
+    @classmethod
+    def from_dict(cls, data):
+        result = cls(data['chunks'])
+        result.nets = {float(net): rounds for net, rounds in data['nets'].items()}
+        result.counts.update(data['counts'])
+        result.actions.update(data['actions'])
+        return result
+
+
+class ShardSummary:
+    """
+    Exact, mergeable results of one or more shards of a job spec.
+
+    Each shard's ShardResult is kept under its shard id, so merging is a
+    union keyed by shard id: shards present in both summaries are counted
+    once, whichever summaries they arrive in. Results are histograms rather
+    than running moments, so totals only add integer counts and any subset
+    of shards gives the same result in any order; stats() derives the
+    moments with math.fsum.
+    """
+
+    def __init__(self, spec_id):
+        self.spec_id = spec_id
+        # shard id -> ShardResult
+        self.shards = {}
+
+    def merge(self, other):
+        """
+        Adds the shards of another summary of the same spec that this one
+        does not have yet and returns self.
+        """
+        if other.spec_id != self.spec_id:
+            raise ValueError(f"Cannot merge summaries of different job specs ({self.spec_id}, {other.spec_id}).")
+        for key, result in other.shards.items():
+            if key in self.shards:
+                continue
+            start, stop = result.chunks
+            for merged in self.shards.values():
+                merged_start, merged_stop = merged.chunks
+                if start < merged_stop and merged_start < stop:
+                    # Shards of different splits of the spec cannot be separated exactly
+                    raise ValueError(f"Chunks {start}-{stop} overlap merged chunks {merged_start}-{merged_stop}.")
+            self.shards[key] = result
+        return self
+
+    def _total(self, name):
+        total = {}
+        for result in self.shards.values():
+            for key, count in getattr(result, name).items():
+                total[key] = total.get(key, 0) + count
+        return total
+
+    @property
+    def nets(self):
+        return self._total('nets')
+
+    @property
+    def counts(self):
+        return dict(dict.fromkeys(RESULTS, 0), **self._total('counts'))
+
+    @property
+    def actions(self):
+        return dict(dict.fromkeys(ACTIONS, 0), **self._total('actions'))
+
+    @property
+    def rounds(self):
+        return sum(self.nets.values())
+
+    def chunks(self):
+        """
+        Returns the sorted chunk indexes covered by the merged shards.
+        """
+        return sorted(index for result in self.shards.values() for index in range(*result.chunks))
+
+    def stats(self):
+        """
+        Returns the merged results as a RunningStats.
+        """
+        stats = RunningStats()
+        nets = self.nets
+        rounds = sum(nets.values())
+        if rounds:
+            stats.rounds = rounds
+            stats.mean = math.fsum(net * count for net, count in nets.items()) / rounds
+            stats.m2 = math.fsum(count * (net - stats.mean) ** 2 for net, count in nets.items())
+        stats.counts.update(self.counts)
+        return stats
+
+    def to_dict(self):
+        return {'spec_id': self.spec_id,
+                'shards': {key: result.to_dict() for key, result in sorted(self.shards.items())}}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls(data['spec_id'])
+        summary.shards = {key: ShardResult.from_dict(result) for key, result in data['shards'].items()}
+        return summary
+
+
+class DecisionCounter(EventSink):
+    """
+    Event sink that counts the actions taken into a ShardResult.
+    """
+
+    def __init__(self, result):
+        self.actions = result.actions
+
+    def emit(self, kind, **data):
+        if kind == 'action':
+            self.actions[data['action']] += 1
+
+
+def run_shard(shard):
+    """
+    Plays every chunk of a shard spec and returns its ShardSummary.
+    """
+    rules = Rules(**shard['rules'])
+    strategy = make_strategy(shard['strategy'], rules)
+    summary = ShardSummary(shard['id'])
+    start, stop = shard['chunks']
+    result = summary.shards[shard_id(shard)] = ShardResult([start, stop])
+    counter = DecisionCounter(result)
+    for index in range(start, stop):
+        rounds = min(shard['chunk_rounds'], shard['rounds'] - index * shard['chunk_rounds'])
+        game = chunk_game(rules, strategy, shard['seed'], index, result, event_sink=counter)
+        play_rounds(game, result, rounds)
+    return summary
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_shards(spec, shards, directory):
+    """
+    Writes the shard specs of spec to directory/shards and returns their paths.
+    """
+    paths = []
+    for shard in split_spec(spec, shards):
+        path = os.path.join(directory, 'shards', f"{shard_id(shard)}.json")
+        _write_json(path, shard)
+        paths.append(path)
+    return paths
+
+
+def _claim(directory, key):
+    # Creating the claim file is atomic, so two workers never take the same shard
+    os.makedirs(os.path.join(directory, 'claims'), exist_ok=True)
+    try:
+        os.close(os.open(os.path.join(directory, 'claims', key), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+def work(directory, limit=None, ignore_claims=False, log=None):
+    """
+    Runs unclaimed shards from directory/shards, writing each summary to
+    directory/summaries, until none are left or limit shards are done.
+    Several workers can share a directory. ignore_claims reruns shards
+    claimed by workers that died; merge() drops any duplicates. Returns
+    the number of shards run.
+    """
+    done = 0
+    for path in sorted(glob.glob(os.path.join(directory, 'shards', '*.json'))):
+        if limit is not None and done >= limit:
+            break
+        shard = _read_json(path)
+        key = shard_id(shard)
+        output = os.path.join(directory, 'summaries', f"{key}.json")
+        if os.path.exists(output) or not (_claim(directory, key) or ignore_claims):
+            continue
+        _write_json(output, run_shard(shard).to_dict())
+        done += 1
+        if log:
+            log(f"[{os.getpid()}] shard {shard['shard'] + 1}/{shard['shards']} done")
+    return done
+
+
+def merge(paths):
+    """
+    Merges shard summary files (duplicates included) into one ShardSummary.
+    """
+    merged = None
+    for path in paths:
+        summary = ShardSummary.from_dict(_read_json(path))
+        merged = summary if merged is None else merged.merge(summary)
+    if merged is None:
+        raise ValueError("No summaries to merge.")
+    return merged
+
+
+def _summary_paths(paths):
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(glob.glob(os.path.join(path, 'summaries', '*.json'))))
+        else:
+            result.append(path)
+    return result
+
+
+def _report(summary, spec=None):
+    stats = summary.stats()
+    lines = [f"{len(summary.shards)} shards, {stats.rounds} rounds: EV {stats.ev:+.5f} +/- {stats.stderr:.5f}",
+             f"Outcomes: {stats.counts}",
+             f"Decisions: {summary.actions}"]
+    if spec is not None:
+        missing = sorted(set(range(chunk_count(spec))) - set(summary.chunks()))
+        lines.append(f"Missing chunks: {missing}" if missing else "All chunks present.")
+    return '\n'.join(lines)
+
+
+def _demo(workers, shards, rounds):
+    import tempfile
+    from simulation import run_simulation
+    from strategy import BasicStrategy
+
+    spec = job_spec(Rules(), 'basic', seed=42, rounds=rounds, chunk_rounds=25000)
+    with tempfile.TemporaryDirectory() as directory:
+        write_shards(spec, shards, directory)
+        processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'work', directory])
+                     for _ in range(workers)]
+        for process in processes:
+            process.wait()
+        paths = sorted(glob.glob(os.path.join(directory, 'summaries', '*.json')))
+        # A rerun shard shows up twice and must only count once
+        duplicate = os.path.join(directory, 'summaries', 'duplicate.json')
+        shutil.copy(paths[0], duplicate)
+        summary = merge(_summary_paths([directory]))
+        print(_report(summary, spec))
+
+    expected = run_simulation(Rules(), BasicStrategy(), rounds, 25000, workers=1, seed=42)
+    print(f"run_simulation: {expected}")
+    print(f"Counts match: {expected.counts == summary.counts}, "
+          f"EV difference {abs(expected.ev - summary.stats().ev):.1e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split simulations into shards, run them and merge the results.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    spec = commands.add_parser('spec', help="write a job spec")
+    spec.add_argument('output')
+    spec.add_argument('--decks', type=int, default=6)
+    spec.add_argument('--h17', action='store_true', help="dealer hits soft 17")
+    spec.add_argument('--strategy', choices=STRATEGIES, default='basic')
+    spec.add_argument('--seed', type=int, default=0)
+    spec.add_argument('--rounds', type=int, default=1000000)
+    spec.add_argument('--chunk-rounds', type=int, default=100000)
+
+    split = commands.add_parser('split', help="split a job spec into shard specs in a directory")
+    split.add_argument('spec')
+    split.add_argument('directory')
+    split.add_argument('--shards', type=int, required=True)
+
+    worker = commands.add_parser('work', help="run unclaimed shards in a directory")
+    worker.add_argument('directory')
+    worker.add_argument('--limit', type=int, help="stop after this many shards")
+    worker.add_argument('--ignore-claims', action='store_true', help="also run shards other workers claimed")
+
+    combine = commands.add_parser('merge', help="merge shard summaries")
+    combine.add_argument('paths', nargs='+', help="summary files, or directories with a summaries folder")
+    combine.add_argument('--spec', help="report chunks of this spec that are missing")
+    combine.add_argument('--output', help="write the merged summary here")
+
+    demo = commands.add_parser('demo', help="run local workers against a temporary directory")
+    demo.add_argument('--workers', type=int, default=3)
+    demo.add_argument('--shards', type=int, default=8)
+    demo.add_argument('--rounds', type=int, default=200000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'spec':
+        rules = Rules(number_of_decks=args.decks, dealer_hits_soft_17=args.h17)
+        _write_json(args.output, job_spec(rules, args.strategy, args.seed, args.rounds, args.chunk_rounds))
+    elif args.command == 'split':
+        paths = write_shards(_read_json(args.spec), args.shards, args.directory)
+        print(f"Wrote {len(paths)} shards to {os.path.join(args.directory, 'shards')}")
+    elif args.command == 'work':
+        done = work(args.directory, args.limit, args.ignore_claims, log=print)
+        print(f"[{os.getpid()}] ran {done} shards")
+    elif args.command == 'merge':
+        summary = merge(_summary_paths(args.paths))
+        print(_report(summary, _read_json(args.spec) if args.spec else None))
+        if args.output:
+            _write_json(args.output, summary.to_dict())
+    else:
+        _demo(args.workers, args.shards, args.rounds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+# simulation.py
+
+import itertools
+import math
+import os
+import random
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+from game import Game
+from players import Player, Dealer
+from events import EventSink, TeeSink
+from counting import TrueCountBuckets, running_count
+
+# Hand results reported by Game, in the order RunningStats counts them
+RESULTS = ('win', 'push', 'lose', 'blackjack', 'surrender')
+
+# Default cap on run_until, so an unreachable ci_width still terminates
+MAX_SEQUENTIAL_ROUNDS = 100000000
+
+SequentialResult = namedtuple('SequentialResult', ['stats', 'rounds', 'ev', 'std', 'ci_low', 'ci_high', 'converged'])
+
+
+class RunningStats:
+    """
+    Mergeable statistics of per-round net results, in units of the table
+    minimum (the initial bet when betting flat).
+
+    The mean and variance are kept with Welford's online algorithm and
+    combined with Chan's parallel formula, so partial results from separate
+    chunks can be merged without keeping the individual rounds.
+    """
+
+    def __init__(self):
+        self.rounds = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.counts = dict.fromkeys(RESULTS, 0)
+        # Per-true-count results when the run tracks a count (see counting.py)
+        self.true_counts = None
+
+    def add(self, net):
+        self.rounds += 1
+        delta = net - self.mean
+        self.mean += delta / self.rounds
+        self.m2 += delta * (net - self.mean)
+
+    def merge(self, other):
+        """
+        Adds another RunningStats into this one and returns self.
+        """
+        if other.rounds:
+            rounds = self.rounds + other.rounds
+            delta = other.mean - self.mean
+            self.mean += delta * other.rounds / rounds
+            self.m2 += other.m2 + delta * delta * self.rounds * other.rounds / rounds
+            self.rounds = rounds
+        for result, count in other.counts.items():
+            self.counts[result] += count
+        if other.true_counts is not None:
+            if self.true_counts is None:
+                self.true_counts = TrueCountBuckets(other.true_counts.low, other.true_counts.high)
+            self.true_counts.merge(other.true_counts)
+        return self
+
+    @property
+    def ev(self):
+        return self.mean
+
+    @property
+    def variance(self):
+        return self.m2 / (self.rounds - 1) if self.rounds > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def stderr(self):
+        return self.std / math.sqrt(self.rounds) if self.rounds else 0.0
+
+    def confidence_interval(self, confidence=0.95):
+        """
+        Returns the normal-approximation (low, high) interval on the EV.
+        """
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * self.stderr
+        return self.mean - half_width, self.mean + half_width
+
+    def to_dict(self):
+        data = {'rounds': self.rounds, 'mean': self.mean, 'm2': self.m2, 'counts': dict(self.counts)}
+        if self.true_counts is not None:
+            data['true_counts'] = self.true_counts.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.rounds = data['rounds']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        stats.counts.update(data['counts'])
+        if data.get('true_counts') is not None:
+            stats.true_counts = TrueCountBuckets.from_dict(data['true_counts'])
+        return stats
+
+    def __repr__(self):
+        return (f"RunningStats(rounds={self.rounds}, ev={self.ev:.5f}, std={self.std:.4f}, "
+                f"counts={self.counts})")
+
+
+class OutcomeCounter(EventSink):
+    """
+    Event sink that counts hand results into a RunningStats.
+    """
+
+    def __init__(self, stats):
+        self.counts = stats.counts
+
+    def emit(self, kind, **data):
+        if kind == 'hand_result':
+            self.counts[data['result']] += 1
+        elif kind == 'hand_surrendered':
+            self.counts['surrender'] += 1
+
+
+def chunk_rng(seed, chunk_index):
+    """
+    Returns the random.Random stream for one chunk of a seeded run.
+
+    Streams depend only on (seed, chunk_index), never on which worker runs
+    the chunk, so a run is reproducible for any number of workers.
+    """
+    return random.Random(f"{seed}/{chunk_index}")
+
+
+def run_chunk(rules, strategy, rounds, seed, chunk_index, compact_shoe=True, count_system=None,
+              bet_policy=None, shoe=None):
+    """
+    Plays one chunk of rounds on a fresh single-seat Game and returns its RunningStats.
+
+    Net results are in units of the table minimum. With count_system the
+    stats also get true_counts, the results per initial bet bucketed by the
+    true count before each round; bet_policy and shoe (a shoe class or
+    factory) are passed on to Game.
+    """
+    stats = RunningStats()
+    game = chunk_game(rules, strategy, seed, chunk_index, stats, compact_shoe, count_system, bet_policy, shoe)
+    play_rounds(game, stats, rounds, count_system)
+    return stats
+
+
+def chunk_game(rules, strategy, seed, chunk_index, stats, compact_shoe=True, count_system=None,
+               bet_policy=None, shoe=None, event_sink=None):
+    """
+    Returns the single-seat Game that plays a chunk of a seeded run,
+    counting hand results into stats. event_sink also gets every event.
+    """
+    player = Player(bankroll=0, strategy=strategy, name=f"Chunk_{chunk_index}")
+    sink = OutcomeCounter(stats)
+    if event_sink is not None:
+        sink = TeeSink(sink, event_sink)
+    game = Game(players=[player], dealer=Dealer(), rules=rules, compact_shoe=compact_shoe,
+                event_sink=sink, rng=chunk_rng(seed, chunk_index), bet_policy=bet_policy,
+                pool_hands=True, shoe=shoe)
+    if count_system is not None:
+        running_count(game.shoe, count_system)
+        if stats.true_counts is None:
+            stats.true_counts = TrueCountBuckets()
+    return game
+
+
+def play_rounds(game, stats, rounds, count_system=None):
+    """
+    Plays rounds more rounds of a chunk_game and adds their results to stats.
+    """
+    player = game.players[0]
+    unit = game.table_limits[0]
+    count = None
+    if count_system is not None:
+        count = running_count(game.shoe, count_system)
+        buckets = stats.true_counts
+    for _ in range(rounds):
+        if count is not None:
+            true_count = count.true_count()
+        # Let Game ask bet_policy once and read back the bet it placed, so a
+        # stateful or random policy is recorded with the bet actually played
+        player.bankroll = math.inf
+        game.begin_round()
+        bet = player.hands[0].bet
+        # Top up so the seat can always cover doubles and splits
+        player.bankroll = bet * 15.0
+        if not game.round_over:
+            game.player_actions()
+            game.dealer_actions()
+        game.finish_round()
+        net = player.bankroll - bet * 15.0 - bet
+        stats.add(net / unit)
+        if count is not None:
+            buckets.add(true_count, net / bet)
+
+
+def _run_chunk(args):
+    return run_chunk(*args)
+
+
+def _imap_ordered(function, arguments, workers):
+    """
+    Lazily maps function over arguments, yielding results in order while
+    keeping at most workers calls in flight, so the caller can stop early.
+    """
+    if workers == 1:
+        yield from map(function, arguments)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque(executor.submit(function, argument)
+                          for argument in itertools.islice(arguments, workers))
+        try:
+            while in_flight:
+                result = in_flight.popleft().result()
+                for argument in itertools.islice(arguments, 1):
+                    in_flight.append(executor.submit(function, argument))
+                yield result
+        finally:
+            # Drop queued calls when the caller stops early
+            for future in in_flight:
+                future.cancel()
+
+
+def iter_simulation(rules, strategy, total_rounds, chunk_rounds=100000, workers=None, seed=0,
+                    count_system=None, bet_policy=None, shoe=None):
+    """
+    Runs total_rounds rounds split into chunks across a process pool.
+
+    Yields (chunk_index, chunk_stats, total_stats) in chunk order, each as
+    soon as it and every earlier chunk are done. At most workers chunks are
+    in flight, so a caller that stops early leaves no queued work behind.
+    total_stats is a snapshot, safe to keep. Merging in chunk order keeps
+    the totals bit-identical for a given seed regardless of the number of
+    workers.
+    """
+    chunks = ((rules, strategy, min(chunk_rounds, total_rounds - start), seed, index, True,
+               count_system, bet_policy, shoe)
+              for index, start in enumerate(range(0, total_rounds, chunk_rounds)))
+    total = RunningStats()
+    results = _imap_ordered(_run_chunk, chunks, workers)
+    try:
+        for index, stats in enumerate(results):
+            total.merge(stats)
+            yield index, stats, RunningStats.from_dict(total.to_dict())
+    finally:
+        results.close()
+
+
+def run_until(rules, strategy, ci_width, confidence=0.95, chunk_rounds=100000, max_rounds=MAX_SEQUENTIAL_ROUNDS,
+              workers=None, seed=0, count_system=None, bet_policy=None, shoe=None):
+    """
+    Runs chunks of rounds until the confidence interval on EV per round,
+    in units of the table minimum, is no wider than ci_width, or max_rounds
+    have been played. With a bet_policy the EV is per round as bet, not
+    per initial bet, so ci_width is in the same table-minimum units.
+    max_rounds must be finite, since a ci_width too narrow for the game's
+    variance would otherwise never be reached.
+
+    The stopping rule is checked once per chunk against the merged
+    RunningStats, so it adds nothing per round. Chunks use the same
+    streams as iter_simulation and are merged in order, so the stopping
+    point and the result depend only on seed and chunk_rounds, not on the
+    number of workers. Returns a SequentialResult.
+    """
+    if max_rounds is None or max_rounds <= 0:
+        raise ValueError("run_until needs a positive max_rounds.")
+
+    def chunks():
+        for start in range(0, max_rounds, chunk_rounds):
+            index = start // chunk_rounds
+            rounds = min(chunk_rounds, max_rounds - start)
+            yield rules, strategy, rounds, seed, index, True, count_system, bet_policy, shoe
+
+    total = RunningStats()
+    converged = False
+    results = _imap_ordered(_run_chunk, chunks(), workers)
+    for stats in results:
+        total.merge(stats)
+        low, high = total.confidence_interval(confidence)
+        if total.rounds > 1 and high - low <= ci_width:
+            converged = True
+            break
+    results.close()
+    low, high = total.confidence_interval(confidence)
+    return SequentialResult(total, total.rounds, total.ev, total.std, low, high, converged)
+
+
+def run_simulation(rules, strategy, total_rounds, chunk_rounds=100000, workers=None, seed=0,
+                   count_system=None, bet_policy=None, shoe=None):
+    """
+    Runs a full simulation and returns the merged RunningStats.
+    """
+    total = RunningStats()
+    for _, _, total in iter_simulation(rules, strategy, total_rounds, chunk_rounds, workers, seed,
+                                       count_system, bet_policy, shoe):
+        pass
+    return total
+
+
+# Test for the Monte Carlo runner
+if __name__ == "__main__":
+    from rules import Rules
+    from strategy import BasicStrategy
+
+    rules = Rules()
+    for workers in (1, 4):
+        stats = run_simulation(rules, BasicStrategy(), total_rounds=200000, chunk_rounds=25000,
+                               workers=workers, seed=42)
+        print(f"{workers} worker(s): {stats}")  # Identical for any number of workers
+
+    result = run_until(rules, BasicStrategy(), ci_width=0.02, chunk_rounds=25000, seed=42)
+    print(f"Stopped after {result.rounds} rounds: EV {result.ev:.4f}, std {result.std:.4f}, "
+          f"95% CI [{result.ci_low:.4f}, {result.ci_high:.4f}]")
+
+    from counting import HI_LO, BetSpread
+    stats = run_simulation(rules, BasicStrategy(), total_rounds=200000, chunk_rounds=25000, seed=42,
+                           count_system=HI_LO, bet_policy=BetSpread(HI_LO, {2: 2, 3: 4, 4: 8}))
+    print(f"Hi-Lo 1-8 spread: {stats.ev:.4f} units per round")
+    for true_count, rounds, ev, stderr in stats.true_counts.rows():
+        print(f"  TC {true_count:+3}: {rounds:7} rounds, EV {ev:+.4f} +/- {stderr:.4f}")
+
+    from cards import ContinuousShuffler, InfiniteShoe
+    for shoe in (ContinuousShuffler, InfiniteShoe):
+        stats = run_simulation(rules, BasicStrategy(), total_rounds=200000, chunk_rounds=25000, seed=42, shoe=shoe)
+        print(f"{shoe.__name__}: EV {stats.ev:.4f} +/- {stats.stderr:.4f}")
@@ -1,5 +1,12 @@
 # strategy.py
 
+import hashlib
+from array import array
+from collections import OrderedDict, namedtuple
+
+from cards import Card
+from rules import Rules
+
 class Strategy:
     """
     Base class for player strategies.
@@ -9,28 +16,387 @@ class Strategy:
         raise NotImplementedError("Strategy must implement decide_action method.")
 
 
+# Action codes used by decision tables
+HIT, STAND, DOUBLE, SPLIT, SURRENDER = range(5)
+ACTIONS = ('hit', 'stand', 'double', 'split', 'surrender')
+# Bits Game sets in Hand.action_flags for each action a hand takes
+HIT_FLAG, STAND_FLAG, DOUBLE_FLAG, SPLIT_FLAG, SURRENDER_FLAG = (1 << code for code in range(len(ACTIONS)))
+ACTION_FLAGS = dict(zip(ACTIONS, (HIT_FLAG, STAND_FLAG, DOUBLE_FLAG, SPLIT_FLAG, SURRENDER_FLAG)))
+# Pair table entry meaning "play the pair as a hard or soft total"
+NO_SPLIT = -1
+
+# Hand phases: a hand's first two cards, two cards after a split, three or more cards
+FIRST_TWO, SPLIT_TWO, LATER = range(3)
+PHASES = 3
+TOTALS = 22     # Hard/soft rows are indexed by best hand value 0-21
+UP_CARDS = 12   # Columns are indexed by dealer up-card value 2-11 (Ace = 11)
+RANKS = len(Card.RANKS)
+RANK_INDEX = {rank: index for index, rank in enumerate(Card.RANKS)}
+
+
+def total_index(phase, total, up_card_value):
+    return (phase * TOTALS + total) * UP_CARDS + up_card_value
+
+
+def pair_index(phase, pair_value, up_card_value):
+    return (phase * UP_CARDS + pair_value) * UP_CARDS + up_card_value
+
+
+def split_index(split_count, first_rank, second_rank, up_card_value):
+    return ((split_count * RANKS + first_rank) * RANKS + second_rank) * UP_CARDS + up_card_value
 
-class BasicStrategy(Strategy):
+
+def build_split_table(pair, rules):
+    """
+    Folds the splitting rules into a pair table.
+
+    The result is indexed with split_index(split_count, first_rank,
+    second_rank, up_card_value), using RANK_INDEX for the two cards, and
+    holds SPLIT only where the pair table splits and Hand.can_split would
+    allow it: the ranks match (or are unlike tens where allowed), aces are
+    split and resplit as allowed, and split_count is below max_splits.
+    """
+    splitting_rules = rules.splitting_rules
+    max_splits = splitting_rules.get('max_splits', 3)
+    can_split_aces = splitting_rules.get('can_split_aces', True)
+    resplit_aces = splitting_rules.get('resplit_aces_allowed', False)
+    unlike_tens = splitting_rules.get('can_split_unlike_tens', False)
+    splits = [NO_SPLIT] * ((max_splits + 1) * RANKS * RANKS * UP_CARDS)
+    for split_count in range(max_splits):
+        phase = SPLIT_TWO if split_count else FIRST_TWO
+        for first, first_rank in enumerate(Card.RANKS):
+            value = Card.VALUES[first_rank]
+            if first_rank == 'A' and not (can_split_aces and (resplit_aces or not split_count)):
+                continue
+            for second, second_rank in enumerate(Card.RANKS):
+                if second_rank != first_rank and not (unlike_tens and value == Card.VALUES[second_rank] == 10):
+                    continue
+                for up in range(2, 12):
+                    splits[split_index(split_count, first, second, up)] = pair[pair_index(phase, value, up)]
+    return tuple(splits)
+
+
+class TableStrategy(Strategy):
     """
-    Implements a basic Blackjack strategy.
+    Plays from precomputed hard, soft and pair decision tables.
+
+    The tables are flat sequences of action codes. Hard and soft tables are
+    indexed with total_index(phase, total, up_card_value) and the pair table
+    with pair_index(phase, pair_value, up_card_value), where pair entries are
+    SPLIT or NO_SPLIT. Tables must only contain actions the rules allow for
+    that phase and total, because Game asks again when an action is refused.
+
+    The splitting rules are folded into a split table (see
+    build_split_table) once per rule configuration, so a decision never
+    checks them.
     """
 
+    def __init__(self, hard, soft, pair):
+        self.hard = tuple(hard)
+        self.soft = tuple(soft)
+        self.pair = tuple(pair)
+        self.split_rules = None
+        self.split_tables = {}
+
+    def use_split_rules(self, rules):
+        key = rules.key()
+        splits = self.split_tables.get(key)
+        if splits is None:
+            splits = self.split_tables[key] = build_split_table(self.pair, rules)
+        self.splits = splits
+        self.split_rules = rules
+
+    @classmethod
+    def from_function(cls, decide):
+        """
+        Builds the tables by calling decide(kind, phase, total, up_card_value)
+        for every cell. kind is 'hard', 'soft' or 'pair'; for pairs, total
+        is the value of one pair card.
+        """
+        hard = [STAND] * (PHASES * TOTALS * UP_CARDS)
+        soft = [STAND] * (PHASES * TOTALS * UP_CARDS)
+        pair = [NO_SPLIT] * (PHASES * UP_CARDS * UP_CARDS)
+        for phase in range(PHASES):
+            for up in range(2, 12):
+                for total in range(4, 22):
+                    hard[total_index(phase, total, up)] = decide('hard', phase, total, up)
+                for total in range(12, 22):
+                    soft[total_index(phase, total, up)] = decide('soft', phase, total, up)
+                if phase != LATER:
+                    for value in range(2, 12):
+                        pair[pair_index(phase, value, up)] = decide('pair', phase, value, up)
+        return cls(hard, soft, pair)
+
     def decide_action(self, hand, dealer_up_card, rules):
-        best_value = hand.get_best_value()
-        if best_value < 17:
-            return 'hit'
+        if rules is not self.split_rules:
+            self.use_split_rules(rules)
+        up = dealer_up_card.get_value()
+        cards = hand.cards
+        if len(cards) == 2:
+            if self.splits[split_index(hand.split_count, RANK_INDEX[cards[0].rank],
+                                       RANK_INDEX[cards[1].rank], up)] == SPLIT:
+                return 'split'
+            phase = SPLIT_TWO if hand.is_split else FIRST_TWO
         else:
-            return 'stand'
+            phase = LATER
+        table = self.soft if hand.is_soft() else self.hard
+        return ACTIONS[table[total_index(phase, hand.best_value, up)]]
+
+
+# Multi-deck basic strategy charts. Columns are dealer up cards 2-10, A.
+# H hit, S stand, D double else hit, Ds double else stand, Rh/Rs surrender
+# else hit/stand. Pair cells: P split, Ph split only with double after
+# split, Rp surrender else split, N play as a total.
+HARD_CHART = {
+    9: 'H D D D D H H H H H',
+    10: 'D D D D D D D D H H',
+    11: 'D D D D D D D D D H',
+    12: 'H H S S S H H H H H',
+    13: 'S S S S S H H H H H',
+    14: 'S S S S S H H H H H',
+    15: 'S S S S S H H H Rh H',
+    16: 'S S S S S H H Rh Rh Rh',
+}
+SOFT_CHART = {
+    13: 'H H H D D H H H H H',
+    14: 'H H H D D H H H H H',
+    15: 'H H D D D H H H H H',
+    16: 'H H D D D H H H H H',
+    17: 'H D D D D H H H H H',
+    18: 'S Ds Ds Ds Ds S S H H H',
+}
+PAIR_CHART = {
+    2: 'Ph Ph P P P P N N N N',
+    3: 'Ph Ph P P P P N N N N',
+    4: 'N N N Ph Ph N N N N N',
+    6: 'Ph P P P P N N N N N',
+    7: 'P P P P P P N N N N',
+    8: 'P P P P P P P P P P',
+    9: 'P P P P P N P P N N',
+    11: 'P P P P P P P P P P',
+}
+# Changes to the charts when the dealer hits soft 17, keyed by (total, up card value)
+H17_HARD = {(11, 11): 'D', (15, 11): 'Rh', (17, 11): 'Rs'}
+H17_SOFT = {(18, 2): 'Ds', (19, 6): 'Ds'}
+H17_PAIR = {(8, 11): 'Rp'}
+
+
+def _chart_cell(chart, overrides, total, up, default):
+    cell = overrides.get((total, up))
+    if cell is not None:
+        return cell
+    row = chart.get(total)
+    if row is None:
+        return default
+    # Up card values 2-11 map to columns 0-9
+    return row.split()[up - 2]
+
+
+class BasicStrategy(TableStrategy):
+    """
+    Implements multi-deck basic strategy.
+
+    The charts are resolved into decision tables for each Rules
+    configuration the first time it is seen: doubles respect
+    double_down_allowed_on and double_after_split_allowed, splits respect
+    double after split, surrenders respect surrender_allowed, and the H17
+    chart changes apply when the dealer hits soft 17. Tables are cached per
+    rule configuration and shared between instances.
+
+    Without rules the tables are built for the default Rules(), so the
+    hard, soft and pair tables can always be read directly.
+    """
+
+    _tables = {}
+
+    def __init__(self, rules=None):
+        self.use_rules(rules if rules is not None else Rules())
+
+    def use_rules(self, rules):
+        key = rules.key()
+        tables = self._tables.get(key)
+        if tables is None:
+            tables = self._tables[key] = self.build_tables(rules)
+        self.hard, self.soft, self.pair, self.splits = tables
+        self.rules = self.split_rules = rules
 
+    @staticmethod
+    def build_tables(rules):
+        h17 = rules.dealer_hits_soft_17
+        surrender = rules.surrender_allowed != 'none'
+        doubles = set(rules.double_down_allowed_on)
+
+        def resolve(cell, phase, total):
+            can_double = (phase == FIRST_TWO or (phase == SPLIT_TWO and rules.double_after_split_allowed))
+            if cell == 'D':
+                return DOUBLE if can_double and total in doubles else HIT
+            if cell == 'Ds':
+                return DOUBLE if can_double and total in doubles else STAND
+            if cell in ('Rh', 'Rs'):
+                if surrender and phase == FIRST_TWO:
+                    return SURRENDER
+                return HIT if cell == 'Rh' else STAND
+            return HIT if cell == 'H' else STAND
+
+        def decide(kind, phase, total, up):
+            if kind == 'hard':
+                default = 'H' if total < 12 else 'S'
+                return resolve(_chart_cell(HARD_CHART, H17_HARD if h17 else {}, total, up, default), phase, total)
+            if kind == 'soft':
+                default = 'H' if total < 18 else 'S'
+                return resolve(_chart_cell(SOFT_CHART, H17_SOFT if h17 else {}, total, up, default), phase, total)
+            cell = _chart_cell(PAIR_CHART, H17_PAIR if h17 else {}, total, up, 'N')
+            if cell == 'Rp' and surrender and phase == FIRST_TWO:
+                # Surrender first; the hard 16 row then surrenders the hand
+                return NO_SPLIT
+            if cell == 'Ph' and not rules.double_after_split_allowed:
+                return NO_SPLIT
+            return NO_SPLIT if cell == 'N' else SPLIT
+
+        table = TableStrategy.from_function(decide)
+        return table.hard, table.soft, table.pair, build_split_table(table.pair, rules)
+
+    def decide_action(self, hand, dealer_up_card, rules):
+        if rules is not self.rules:
+            self.use_rules(rules)
+        return TableStrategy.decide_action(self, hand, dealer_up_card, rules)
+
+
+MemoCacheInfo = namedtuple('MemoCacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class MemoizedStrategy(Strategy):
+    """
+    Caches the decisions of a deterministic strategy.
+
+    Decisions are keyed by the rules and a canonical decision state: hard
+    total, best value (which tells soft from hard), number of cards, pair
+    value and whether the pair ranks match, split flag and split count,
+    and the dealer's up-card value. The wrapped strategy must not depend on
+    anything else, such as the exact cards of a multi-card hand.
+
+    The cache holds at most maxsize decisions (None for no limit) and
+    evicts the least recently used ('lru') or the oldest ('fifo') entry.
+    Strategies that look at the shoe can pass composition_key, a callable
+    returning a hashable bucket of the current shoe (e.g. a rounded true
+    count from counting.running_count), which is added to every key.
+    """
+
+    def __init__(self, strategy, maxsize=4096, eviction='lru', composition_key=None):
+        if eviction not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown eviction policy '{eviction}'.")
+        self.strategy = strategy
+        self.maxsize = maxsize
+        self.lru = eviction == 'lru'
+        self.composition_key = composition_key
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rules = None
+        self._rules_ids = {}
+        self._rules_id = None
+
+    def decide_action(self, hand, dealer_up_card, rules):
+        if rules is not self._rules:
+            # Equal rules share an id, so new but identical Rules objects still hit
+            self._rules = rules
+            self._rules_id = self._rules_ids.setdefault(rules.key(), len(self._rules_ids))
+        cards = hand.cards
+        pair = 0
+        same_rank = False
+        if len(cards) == 2:
+            value = cards[0].get_value()
+            if value == cards[1].get_value():
+                pair = value
+                same_rank = cards[0].rank == cards[1].rank
+        key = (self._rules_id, hand.hard_total, hand.best_value, len(cards), pair, same_rank,
+               hand.is_split, hand.split_count, dealer_up_card.get_value())
+        if self.composition_key is not None:
+            key += (self.composition_key(),)
+
+        cache = self.cache
+        action = cache.get(key)
+        if action is not None:
+            self.hits += 1
+            if self.lru:
+                cache.move_to_end(key)
+            return action
+        self.misses += 1
+        action = self.strategy.decide_action(hand, dealer_up_card, rules)
+        cache[key] = action
+        if self.maxsize is not None and len(cache) > self.maxsize:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return action
+
+    def cache_info(self):
+        return MemoCacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.cache))
+
+    def cache_clear(self):
+        self.cache.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def cache_key(self):
+        return strategy_key(self.strategy)
+
+
+def strategy_key(strategy):
+    """
+    Returns a short string identifying a strategy's decisions for cache keys.
+
+    A strategy can name itself with a cache_key() method. BasicStrategy is
+    identified by name, since its tables follow from the rules; other
+    TableStrategies by a digest of their tables. Any other strategy must
+    define cache_key(), because its decisions may depend on parameters its
+    class name does not show.
+    """
+    cache_key = getattr(strategy, 'cache_key', None)
+    if cache_key is not None:
+        return cache_key()
+    if isinstance(strategy, BasicStrategy):
+        return 'basic'
+    if isinstance(strategy, TableStrategy):
+        digest = hashlib.sha256()
+        for table in (strategy.hard, strategy.soft, strategy.pair):
+            digest.update(array('b', table).tobytes())
+        return f"table-{digest.hexdigest()[:16]}"
+    raise ValueError(f"Cannot identify a {type(strategy).__name__} for caching; give it a cache_key() method.")
+
+
+# Strategies that can be named in job specs and on the command line
+STRATEGIES = ('basic', 'optimal')
+
+
+def make_strategy(name, rules):
+    """
+    Returns the strategy called name in STRATEGIES for rules.
+    """
+    if name == 'basic':
+        return BasicStrategy(rules)
+    if name == 'optimal':
+        # optimal_strategy imports this module
+        from optimal_strategy import optimal_strategy
+        return optimal_strategy(rules)
+    raise ValueError(f"Unknown strategy '{name}'.")
 
 
 # Test for BasicStrategy class
 if __name__ == "__main__":
     from hand import Hand
     from cards import Card
-    strategy = BasicStrategy()
+    from rules import Rules
+    rules = Rules(surrender_allowed='late')
+    strategy = BasicStrategy(rules)
     hand = Hand()
     hand.add_card(Card('9', 'Hearts'))
     hand.add_card(Card('7', 'Diamonds'))
-    action = strategy.decide_action(hand, None, None)  # Dealer's up card and rules are not used here
-    print(f"Decided action: {action}")  # Output: 'hit'
+    action = strategy.decide_action(hand, Card('10', 'Spades'), rules)
+    print(f"Decided action: {action}")  # Output: 'surrender'
+    action = strategy.decide_action(hand, Card('6', 'Spades'), rules)
+    print(f"Decided action: {action}")  # Output: 'stand'
+
+    memoized = MemoizedStrategy(strategy, maxsize=2)
+    for up_rank in ('10', '6', '10', '10'):
+        memoized.decide_action(hand, Card(up_rank, 'Spades'), rules)
+    print(memoized.cache_info())  # Output: MemoCacheInfo(hits=2, misses=2, evictions=0, maxsize=2, currsize=2)
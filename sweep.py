@@ -0,0 +1,161 @@
+# sweep.py
+
+import itertools
+import json
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from rules import Rules
+from simulation import RunningStats, _run_chunk
+from strategy import BasicStrategy, strategy_key
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'blackjack-simulation', 'sweeps')
+
+# Rules fields a sweep grid may vary
+SWEEP_FIELDS = ('number_of_decks', 'dealer_hits_soft_17', 'blackjack_payout', 'surrender_allowed',
+                'double_after_split_allowed', 'splitting_rules')
+
+SweepCell = namedtuple('SweepCell', ['rules', 'stats', 'chunks'])
+
+
+def rules_grid(base=None, **fields):
+    """
+    Returns one Rules per combination of the given field values, e.g.
+    rules_grid(dealer_hits_soft_17=[False, True], number_of_decks=[2, 6]).
+    Fields not listed keep their value from base (default Rules()).
+    """
+    for name in fields:
+        if name not in SWEEP_FIELDS:
+            raise ValueError(f"Cannot sweep '{name}'; choose from {', '.join(SWEEP_FIELDS)}.")
+    base = (base or Rules()).to_dict()
+    names = list(fields)
+    return [Rules(**dict(base, **dict(zip(names, values))))
+            for values in itertools.product(*(fields[name] for name in names))]
+
+
+def cache_path(rules, strategy, seed, chunk_rounds, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, f"{rules.stable_hash()}-{strategy_key(strategy)}-{seed}-{chunk_rounds}.json")
+
+
+def load_chunks(path):
+    """
+    Returns the per-chunk RunningStats cached at path, or [] if there are none.
+    """
+    try:
+        with open(path) as file:
+            return [RunningStats.from_dict(data) for data in json.load(file)['chunks']]
+    except (FileNotFoundError, ValueError, KeyError):
+        return []
+
+
+def save_chunks(path, chunks):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump({'chunks': [stats.to_dict() for stats in chunks]}, file)
+    os.replace(temporary, path)
+
+
+def sweep(grid, strategy, rounds, chunk_rounds=100000, seed=0, workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Simulates every Rules in grid with common random numbers and returns a
+    SweepCell per variant.
+
+    strategy is a Strategy, or a callable taking Rules and returning one
+    (e.g. optimal_strategy). Every variant plays chunk i from the same
+    random stream, so variants with the same number of decks see the same
+    shuffled shoes and their differences have far less variance than
+    independent runs; see difference(). Chunks are cached in cache_dir
+    keyed by rules hash, strategy and seed, and only missing chunks are
+    simulated. Pass cache_dir=None to disable the cache; otherwise a
+    strategy that is not a TableStrategy needs a cache_key() method (see
+    strategy.strategy_key).
+    """
+    chunk_count = math.ceil(rounds / chunk_rounds)
+    cells = []
+    jobs = []
+    for rules in grid:
+        cell_strategy = strategy if hasattr(strategy, 'decide_action') else strategy(rules)
+        path = cache_path(rules, cell_strategy, seed, chunk_rounds, cache_dir) if cache_dir else None
+        chunks = load_chunks(path) if path else []
+        # Chunks beyond the requested count stay cached but are not used
+        chunks = chunks[:chunk_count] + [None] * (chunk_count - len(chunks))
+        for index in range(chunk_count):
+            size = min(chunk_rounds, rounds - index * chunk_rounds)
+            if chunks[index] is None or chunks[index].rounds != size:
+                chunks[index] = None
+                jobs.append((len(cells), index, (rules, cell_strategy, size, seed, index)))
+        cells.append((rules, path, chunks))
+
+    if jobs:
+        arguments = [args for _, _, args in jobs]
+        if workers == 1:
+            results = list(map(_run_chunk, arguments))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_run_chunk, arguments))
+        for (cell, index, _), stats in zip(jobs, results):
+            cells[cell][2][index] = stats
+        for cell in {cell for cell, _, _ in jobs}:
+            _, path, chunks = cells[cell]
+            if path:
+                save_chunks(path, _merge_cached(path, chunks))
+
+    result = []
+    for rules, _, chunks in cells:
+        total = RunningStats()
+        for stats in chunks:
+            total.merge(stats)
+        result.append(SweepCell(rules, total, chunks))
+    return result
+
+
+def _merge_cached(path, chunks):
+    # Keep cached chunks beyond this sweep's count when saving
+    cached = load_chunks(path)
+    return chunks + cached[len(chunks):]
+
+
+def difference(cell, baseline):
+    """
+    Returns (ev difference, standard error) of cell minus baseline.
+
+    With common random numbers the chunks are paired, so the error comes
+    from the spread of per-chunk differences. With a single chunk it falls
+    back to the independent-samples error.
+    """
+    diff = cell.stats.ev - baseline.stats.ev
+    pairs = [(a.ev, b.ev) for a, b in zip(cell.chunks, baseline.chunks)]
+    if len(pairs) < 2:
+        return diff, math.hypot(cell.stats.stderr, baseline.stats.stderr)
+    deltas = [a - b for a, b in pairs]
+    mean = sum(deltas) / len(deltas)
+    variance = sum((delta - mean) ** 2 for delta in deltas) / (len(deltas) - 1)
+    return diff, math.sqrt(variance / len(deltas))
+
+
+def _describe(rules, fields):
+    return ', '.join(f"{name}={getattr(rules, name)}" for name in fields)
+
+
+# Test for the sweep engine
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    fields = {'dealer_hits_soft_17': [False, True], 'surrender_allowed': ['none', 'late']}
+    grid = rules_grid(**fields)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for attempt in ('computed', 'cached'):
+            start = time.time()
+            cells = sweep(grid, BasicStrategy(), rounds=200000, chunk_rounds=20000, seed=7, cache_dir=cache_dir)
+            print(f"Sweep {attempt} in {time.time() - start:.2f}s")
+
+    baseline = cells[0]
+    for cell in cells:
+        diff, stderr = difference(cell, baseline)
+        independent = math.hypot(cell.stats.stderr, baseline.stats.stderr)
+        print(f"{_describe(cell.rules, fields)}: EV {cell.stats.ev:+.4f}, vs baseline {diff:+.4f} "
+              f"+/- {stderr:.4f} (independent runs: +/- {independent:.4f})")